@@ -1,5 +1,8 @@
+from functools import lru_cache
+from os import getenv
 from typing import Optional
 
+from openai import OpenAI as OpenAIClient
 from phi.agent import Agent
 from phi.model.openai import OpenAIChat
 from phi.knowledge.agent import AgentKnowledge
@@ -8,20 +11,35 @@ from phi.tools.duckduckgo import DuckDuckGo
 from phi.vectordb.pgvector import PgVector, SearchType
 
 from agents.settings import agent_settings
-from db.session import db_url
+from db.session import db_engine
 
-example_agent_storage = PgAgentStorage(table_name="example_agent_sessions", db_url=db_url)
+# Storage and knowledge base are shared by every agent in the process.
+# Storage and knowledge base use the app's engine, so the process has a single connection pool.
+example_agent_storage = PgAgentStorage(table_name="example_agent_sessions", db_engine=db_engine)
 example_agent_knowledge = AgentKnowledge(
-    vector_db=PgVector(table_name="example_agent_knowledge", db_url=db_url, search_type=SearchType.hybrid)
+    vector_db=PgVector(
+        table_name="example_agent_knowledge", db_engine=db_engine, search_type=SearchType.hybrid
+    )
 )
 
 
+@lru_cache
+def get_openai_client(api_key: Optional[str]) -> OpenAIClient:
+    """Returns the OpenAI client for `api_key`, shared by every agent so they reuse its connections."""
+    return OpenAIClient(api_key=api_key)
+
+
 def get_example_agent(
     model_id: Optional[str] = None,
     user_id: Optional[str] = None,
     session_id: Optional[str] = None,
     debug_mode: bool = False,
 ) -> Agent:
+    """Returns a new agent for a session.
+
+    Every agent gets its own Agent, OpenAIChat and tools, as the agent writes its session state and tool
+    functions onto them. The OpenAI client, storage and knowledge base are shared.
+    """
     return Agent(
         name="Example Agent",
         agent_id="example-agent",
@@ -32,6 +50,7 @@ def get_example_agent(
             id=model_id or agent_settings.gpt_4,
             max_tokens=agent_settings.default_max_completion_tokens,
             temperature=agent_settings.default_temperature,
+            client=get_openai_client(getenv("OPENAI_API_KEY")),
         ),
         # Tools available to the agent
         tools=[DuckDuckGo()],
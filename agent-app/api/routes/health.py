@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 
+from db.session import async_db_pool_metrics, db_pool_metrics
 from utils.dttm import current_utc_str
 
 ######################################################
@@ -19,3 +20,16 @@ def get_health():
         "path": "/health",
         "utc": current_utc_str(),
     }
+
+
+@health_check_router.get("/health/db-pool")
+def get_db_pool_health():
+    """Connection pool counters, use them to size the pools and detect pool starvation"""
+
+    return {
+        "status": "success",
+        "router": "health",
+        "path": "/health/db-pool",
+        "utc": current_utc_str(),
+        "pools": [db_pool_metrics.snapshot(), async_db_pool_metrics.snapshot()],
+    }
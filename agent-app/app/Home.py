@@ -22,6 +22,7 @@ from phi.tools.streamlit.components import (
 from phi.utils.log import logger
 
 from agents.example import get_example_agent
+from utils.chat_history import ChatHistoryWindow, ImageIndex
 
 nest_asyncio.apply()
 st.set_page_config(
@@ -31,12 +32,17 @@ st.set_page_config(
 st.title("AI Agent")
 st.markdown("##### :orange_heart: built using [phidata](https://github.com/phidatahq/phidata)")
 
+# Number of messages rendered at first and added by "Load older messages"
+HISTORY_PAGE_SIZE = 20
+
 
 def restart_agent():
     logger.debug("---*--- Restarting Agent ---*---")
     st.session_state["example_agent"] = None
     st.session_state["example_agent_session_id"] = None
     st.session_state["uploaded_image"] = None
+    st.session_state["image_index"] = None
+    st.session_state["chat_history"] = None
     if "url_scrape_key" in st.session_state:
         st.session_state["url_scrape_key"] += 1
     if "file_uploader_key" in st.session_state:
@@ -87,37 +93,40 @@ def main() -> None:
         example_agent = st.session_state["example_agent"]
 
     # Create Agent session (i.e. log to database) and save session_id in session state
-    try:
-        st.session_state["example_agent_session_id"] = example_agent.create_session()
-    except Exception:
-        st.warning("Could not create Agent session, is the database running?")
-        return
+    # Only done once per agent, every run writes the session to the database
+    if st.session_state.get("example_agent_session_id") is None:
+        try:
+            st.session_state["example_agent_session_id"] = example_agent.create_session()
+        except Exception:
+            st.warning("Could not create Agent session, is the database running?")
+            return
 
     # Store uploaded image in session state
     uploaded_image = None
     if "uploaded_image" in st.session_state:
         uploaded_image = st.session_state["uploaded_image"]
 
-    # Load existing messages
-    agent_chat_history = example_agent.memory.get_messages()
-    if len(agent_chat_history) > 0:
+    # Load the latest messages, older ones are loaded on demand
+    if st.session_state.get("chat_history") is None:
+        st.session_state["chat_history"] = ChatHistoryWindow(page_size=HISTORY_PAGE_SIZE)
+    chat_history: ChatHistoryWindow = st.session_state["chat_history"]
+    history_messages = chat_history.messages(example_agent.memory)
+    if len(history_messages) > 0:
         logger.debug("Loading chat history")
-        st.session_state["messages"] = agent_chat_history
-        # Search for uploaded image
-        if uploaded_image is None:
-            for message in agent_chat_history:
-                if message.get("role") == "user":
-                    content = message.get("content")
-                    if isinstance(content, list):
-                        for item in content:
-                            if item["type"] == "image_url":
-                                uploaded_image = item["image_url"]["url"]
-                                st.session_state["uploaded_image"] = uploaded_image
-                                break
+        st.session_state["messages"] = history_messages
     else:
         logger.debug("No chat history found")
         st.session_state["messages"] = [{"role": "assistant", "content": "Ask me anything..."}]
 
+    # Search the image index for an uploaded image, only new messages are indexed
+    if st.session_state.get("image_index") is None:
+        st.session_state["image_index"] = ImageIndex()
+    image_index: ImageIndex = st.session_state["image_index"]
+    image_index.update(example_agent.memory)
+    if uploaded_image is None and image_index.latest is not None:
+        uploaded_image = image_index.latest
+        st.session_state["uploaded_image"] = uploaded_image
+
     # Upload Image
     if uploaded_image is None:
         if "image_uploader_key" not in st.session_state:
@@ -143,6 +152,11 @@ def main() -> None:
     if prompt := st.chat_input():
         st.session_state["messages"].append({"role": "user", "content": prompt})
 
+    # Load older messages
+    if chat_history.cursor is not None and st.button("Load older messages"):
+        chat_history.load_older(example_agent.memory)
+        st.rerun()
+
     # Display existing chat messages
     for message in st.session_state["messages"]:
         # Skip system and tool messages
@@ -239,11 +253,15 @@ def main() -> None:
         new_example_agent_session_id = st.sidebar.selectbox("Session ID", options=example_agent_session_ids)
         if st.session_state["example_agent_session_id"] != new_example_agent_session_id:
             logger.info(f"---*--- Loading {model_id} session: {new_example_agent_session_id} ---*---")
+            # Only the current agent is kept, the previous one is dropped
             st.session_state["example_agent"] = get_example_agent(
                 model_id=model_id, session_id=new_example_agent_session_id, debug_mode=True
             )
-            st.session_state["example_agent_session_id"] = new_example_agent_session_id
+            # The session is loaded from the database on the next rerun
+            st.session_state["example_agent_session_id"] = None
             st.session_state["uploaded_image"] = None
+            st.session_state["image_index"] = None
+            st.session_state["chat_history"] = None
             st.rerun()
 
     if st.sidebar.button("New Session"):
@@ -0,0 +1,120 @@
+import time
+from threading import Lock
+from typing import Any, Dict, Optional, Type
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import Pool, QueuePool
+
+from utils.log import logger
+
+
+class PoolMetrics:
+    """Counters for a connection pool, collected from pool events.
+
+    Wait time is measured by the pool class returned from pool_class(), pass it as `poolclass`
+    when creating the engine and then call instrument() with the engine.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool: Optional[Pool] = None
+        self._lock = Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def pool_class(self, base: Type[QueuePool] = QueuePool) -> Type[QueuePool]:
+        """Returns a subclass of `base` that records how long each checkout waits for a connection.
+
+        Only the wait for an idle connection in the pool queue is timed, opening a new connection is not.
+        """
+        metrics = self
+
+        class TimedPool(base):  # type: ignore[valid-type, misc]
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                # Only the queue get blocks on other checkouts, creating a new connection is not timed
+                queue_get = self._pool.get
+
+                def timed_get(block: bool = True, timeout: Optional[float] = None):
+                    start = time.perf_counter()
+                    try:
+                        return queue_get(block, timeout)
+                    finally:
+                        metrics._record_wait(time.perf_counter() - start)
+
+                self._pool.get = timed_get
+
+            def _do_get(self):
+                try:
+                    return super()._do_get()
+                except PoolTimeoutError:
+                    metrics._record_timeout()
+                    raise
+
+        TimedPool.__name__ = f"Timed{base.__name__}"
+        return TimedPool
+
+    def instrument(self, engine: Engine) -> None:
+        """Listens to the pool events of `engine`, for async engines pass `engine.sync_engine`."""
+        self.pool = engine.pool
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        # engine.dispose() replaces the pool
+        event.listen(engine, "engine_disposed", lambda _engine: setattr(self, "pool", _engine.pool))
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self.checkins += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def _record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.wait_time_total += seconds
+            self.wait_time_max = max(self.wait_time_max, seconds)
+
+    def _record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+        logger.warning(f"Timed out waiting for a connection from the {self.name} pool: {self.snapshot()}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the counters plus the current size, checked-out and overflow gauges of the pool."""
+        pool = self.pool
+        with self._lock:
+            return {
+                "name": self.name,
+                "size": pool.size() if isinstance(pool, QueuePool) else None,
+                "checked_out": pool.checkedout() if isinstance(pool, QueuePool) else None,
+                "overflow": pool.overflow() if isinstance(pool, QueuePool) else None,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_time_total": self.wait_time_total,
+                "wait_time_mean": self.wait_time_total / self.checkouts if self.checkouts else 0.0,
+                "wait_time_max": self.wait_time_max,
+            }
+
+    def log(self) -> None:
+        logger.info(f"DB pool metrics: {self.snapshot()}")
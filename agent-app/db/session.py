@@ -1,18 +1,46 @@
-from typing import Generator
+from typing import Any, AsyncGenerator, Dict, Generator
 
 from sqlalchemy.engine import Engine, create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
+from db.metrics import PoolMetrics
 from db.settings import db_settings
 
+# Connection pool options shared by the sync and the async engine
+pool_options: Dict[str, Any] = dict(
+    pool_pre_ping=db_settings.db_pool_pre_ping,
+    pool_size=db_settings.db_pool_size,
+    max_overflow=db_settings.db_max_overflow,
+    pool_recycle=db_settings.db_pool_recycle,
+    pool_timeout=db_settings.db_pool_timeout,
+)
+
 # Create SQLAlchemy Engine using a database URL
 db_url: str = db_settings.get_db_url()
-db_engine: Engine = create_engine(db_url, pool_pre_ping=True)
+db_pool_metrics = PoolMetrics("sync")
+db_engine: Engine = create_engine(db_url, poolclass=db_pool_metrics.pool_class(QueuePool), **pool_options)
+db_pool_metrics.instrument(db_engine)
 
 # Create a SessionLocal class
 # https://fastapi.tiangolo.com/tutorial/sql-databases/#create-a-sessionlocal-class
 SessionLocal: sessionmaker[Session] = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
 
+# Create an async SQLAlchemy Engine for routes that should not block a threadpool worker
+# https://docs.sqlalchemy.org/en/20/orm/extensions/asyncio.html
+async_db_url: str = db_settings.get_async_db_url()
+async_db_pool_metrics = PoolMetrics("async")
+async_db_engine: AsyncEngine = create_async_engine(
+    async_db_url, poolclass=async_db_pool_metrics.pool_class(AsyncAdaptedQueuePool), **pool_options
+)
+async_db_pool_metrics.instrument(async_db_engine.sync_engine)
+
+# Create an AsyncSessionLocal class
+AsyncSessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(
+    bind=async_db_engine, autoflush=False, expire_on_commit=False
+)
+
 
 def get_db() -> Generator[Session, None, None]:
     """
@@ -26,3 +54,14 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency to get an async database session.
+
+    Yields:
+        AsyncSession: An SQLAlchemy async database session.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
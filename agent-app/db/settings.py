@@ -19,6 +19,18 @@ class DbSettings(BaseSettings):
     db_pass: Optional[str] = None
     db_database: Optional[str] = None
     db_driver: str = "postgresql+psycopg"
+    # Driver used by the async engine, must support asyncio
+    db_async_driver: str = "postgresql+psycopg"
+    # Connection pool configuration, applied to both the sync and the async engine
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    # Seconds after which a connection is replaced on checkout, -1 disables it
+    db_pool_recycle: int = -1
+    # Seconds to wait for a connection before raising an error
+    db_pool_timeout: float = 30
+    # Test connections with a round-trip on every checkout. Disable it and set
+    # db_pool_recycle below the server's idle timeout to save the round-trip.
+    db_pool_pre_ping: bool = True
     # Create/Upgrade database on startup using alembic
     migrate_db: bool = False
 
@@ -45,6 +57,10 @@ class DbSettings(BaseSettings):
             raise ValueError("Could not build database connection")
         return db_url
 
+    def get_async_db_url(self) -> str:
+        """Same as get_db_url() but using the async driver."""
+        return "{}://{}".format(self.db_async_driver, self.get_db_url().split("://", 1)[1])
+
 
 # Create DbSettings object
 db_settings = DbSettings()
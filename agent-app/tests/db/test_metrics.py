@@ -0,0 +1,30 @@
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import create_engine
+
+from db.metrics import PoolMetrics
+
+
+def slow_connect() -> sqlite3.Connection:
+    time.sleep(0.2)
+    return sqlite3.connect(":memory:", check_same_thread=False)
+
+
+def test_wait_time_excludes_connect():
+    metrics = PoolMetrics("test")
+    engine = create_engine(
+        "sqlite://", creator=slow_connect, poolclass=metrics.pool_class(), pool_size=1, max_overflow=0
+    )
+    metrics.instrument(engine)
+
+    connection = engine.connect()
+    assert metrics.snapshot()["wait_time_max"] < 0.1
+
+    threading.Timer(0.3, connection.close).start()
+    with engine.connect():
+        pass
+    assert metrics.snapshot()["wait_time_max"] >= 0.25
+    assert metrics.snapshot()["connects"] == 1
+    engine.dispose()
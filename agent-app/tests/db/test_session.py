@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from db.session import async_db_engine, get_async_db
+
+
+async def select_one() -> int:
+    db_generator = get_async_db()
+    db = await db_generator.__anext__()
+    try:
+        result = await db.execute(text("SELECT 1"))
+        return result.scalar_one()
+    finally:
+        await db_generator.aclose()
+        await async_db_engine.dispose()
+
+
+def test_get_async_db():
+    # Fails without greenlet even if the database is not running, SQLAlchemy needs it to run the async driver
+    try:
+        assert asyncio.run(select_one()) == 1
+    except OperationalError as e:
+        pytest.skip(f"Could not connect to the database: {e}")
@@ -0,0 +1,90 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from phi.memory import AgentMemory
+
+
+@dataclass
+class ChatHistoryPage:
+    """A window of the chat history.
+
+    `cursor` is the position of the first message in the window, pass it as `before` to load the
+    previous page. It is None when there are no older messages.
+    """
+
+    messages: List[Dict[str, Any]]
+    cursor: Optional[int]
+
+
+def get_chat_history_page(memory: AgentMemory, limit: int, before: Optional[int] = None) -> ChatHistoryPage:
+    """Returns up to `limit` messages before the position `before` (the latest ones by default).
+
+    Only the messages in the window are serialized, so the cost does not grow with the session length.
+    """
+    end = len(memory.messages) if before is None else min(before, len(memory.messages))
+    start = max(0, end - limit)
+    messages = [message.model_dump(exclude_none=True) for message in memory.messages[start:end]]
+    return ChatHistoryPage(messages=messages, cursor=start if start > 0 else None)
+
+
+class ChatHistoryWindow:
+    """Messages shown in the chat: the latest `page_size` ones plus the older pages loaded with load_older().
+
+    Once an older page is loaded the window is pinned to it, the older pages are kept serialized and only
+    the messages after them are read from memory on every rerun.
+    """
+
+    def __init__(self, page_size: int):
+        self.page_size = page_size
+        self.cursor: Optional[int] = None
+        self.older: List[Dict[str, Any]] = []
+        self.older_end: Optional[int] = None
+
+    def messages(self, memory: AgentMemory) -> List[Dict[str, Any]]:
+        if self.older_end is None:
+            page = get_chat_history_page(memory, limit=self.page_size)
+            self.cursor = page.cursor
+            return page.messages
+
+        page = get_chat_history_page(memory, limit=max(0, len(memory.messages) - self.older_end))
+        return self.older + page.messages
+
+    def load_older(self, memory: AgentMemory) -> None:
+        """Loads the page before the cursor, call messages() first to get the initial cursor."""
+        if self.cursor is None:
+            return
+
+        page = get_chat_history_page(memory, limit=self.page_size, before=self.cursor)
+        if self.older_end is None:
+            self.older_end = self.cursor
+        self.older = page.messages + self.older
+        self.cursor = page.cursor
+
+
+@dataclass
+class ImageIndex:
+    """Image attachments of the user messages in a chat, indexed incrementally.
+
+    Every call to update() only looks at the messages added since the previous call.
+    """
+
+    images: List[str] = field(default_factory=list)
+    indexed: int = 0
+
+    def update(self, memory: AgentMemory) -> None:
+        # The history was replaced e.g. by loading another session
+        if len(memory.messages) < self.indexed:
+            self.images = []
+            self.indexed = 0
+
+        for message in memory.messages[self.indexed :]:
+            if message.role == "user" and isinstance(message.content, list):
+                for item in message.content:
+                    if isinstance(item, dict) and item.get("type") == "image_url":
+                        self.images.append(item["image_url"]["url"])
+        self.indexed = len(memory.messages)
+
+    @property
+    def latest(self) -> Optional[str]:
+        """The image of the most recent user message that has one."""
+        return self.images[-1] if self.images else None
@@ -7,10 +7,12 @@ Val = P.Val
 #access
 Obj = P.Obj
 Rec = P.Rec
+Stream = P.Stream
 
 #pipes
 Seq = P.Seq
 Pipe = P.Pipe
+APipe = P.APipe
 
 #state
 Ref = P.Ref
@@ -19,6 +21,8 @@ Write = P.Write
 
 # flow control
 If = P.If
+And = P.And
+Or = P.Or
 With = P.With
 Context = P.Context
 
@@ -27,6 +31,8 @@ List = P.List
 Dict = P.Dict
 Set = P.Set
 Tuple = P.Tuple
+ParallelList = P.ParallelList
+ParallelDict = P.ParallelDict
 
 # special
 ReadList = P.ReadList
@@ -0,0 +1,233 @@
+"""
+Micro-benchmarks for the hot paths of the DSL: `Seq` depth, `List`/`Dict` fan-out, `Write`/`Read` state churn, operator chains, `ThenAt` partials, `PythonBuilder` method chains and the time it takes to `import phi`. Run them from the command line and store the results to compare them against a later run
+
+    python -m phi.benchmarks --save before.json
+    # ... change something ...
+    python -m phi.benchmarks --compare before.json
+
+`--compare` prints the ratio between the new and the stored times and exits with status `1` if any benchmark got slower by more than `--threshold` (`0.1` by default). Use `--filter` with a regular expression to run only some of them. From python use `phi.benchmarks.run`, `phi.benchmarks.save`, `phi.benchmarks.load` and `phi.benchmarks.compare`.
+
+Every benchmark is a setup function that builds the expression and returns the zero-argument callable being timed, add new ones with the `phi.benchmarks.benchmark` decorator.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import collections
+import json
+import platform
+import re
+import subprocess
+import sys
+import timeit
+
+_BENCHMARKS = collections.OrderedDict()
+
+def benchmark(name, number=1000):
+    "Decorator that registers a setup function as the benchmark `name`, the callable it returns is called `number` times per measurement"
+    def decorator(setup):
+        _BENCHMARKS[name] = (setup, number)
+        return setup
+
+    return decorator
+
+def names(pattern=None):
+    "Returns the names of the registered benchmarks that match the regular expression `pattern`"
+    return [ name for name in _BENCHMARKS if pattern is None or re.search(pattern, name) ]
+
+def run(pattern=None, repeat=5, number=None):
+    """
+Runs the benchmarks whose name matches `pattern` and returns the results as a `dict` that can be passed to `phi.benchmarks.save` and `phi.benchmarks.compare`. Each benchmark is measured `repeat` times and its `best` and `median` time per call (in seconds) are reported, `number` overrides the calls per measurement of every benchmark.
+    """
+    from phi import __version__
+
+    results = collections.OrderedDict()
+
+    for name in names(pattern):
+        setup, default_number = _BENCHMARKS[name]
+        n = number if number is not None else default_number
+        times = sorted(t / n for t in timeit.Timer(setup()).repeat(repeat, n))
+
+        results[name] = dict(best = times[0], median = times[len(times) // 2], number = n, repeat = repeat)
+
+    return dict(
+        python = platform.python_version(),
+        phi = __version__.strip(),
+        benchmarks = results,
+    )
+
+def save(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent = 2)
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare(old, new, threshold=0.1):
+    """
+Compares the `best` times of two results of `phi.benchmarks.run`. Returns a list of `(name, old_time, new_time, ratio, regressed)` tuples for the benchmarks present in both, `regressed` is `True` if `new_time` is more than `threshold` slower than `old_time`.
+    """
+    rows = []
+
+    for name, stats in new["benchmarks"].items():
+        if name not in old["benchmarks"]:
+            continue
+
+        old_time = old["benchmarks"][name]["best"]
+        new_time = stats["best"]
+        ratio = new_time / old_time if old_time else float("inf")
+
+        rows.append((name, old_time, new_time, ratio, ratio > 1.0 + threshold))
+
+    return rows
+
+def _format_time(seconds):
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "{0:.3f} {1}".format(seconds / scale, unit)
+
+    return "{0:.1f} ns".format(seconds / 1e-9)
+
+def _table(rows):
+    widths = [ max(len(row[i]) for row in rows) for i in range(len(rows[0])) ]
+
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+        for row in rows
+    )
+
+#######################
+### Benchmarks
+#######################
+
+def _seq_depth(n):
+    def setup():
+        from phi import P, Seq
+
+        f = Seq(*[ P + 1 for _ in range(n) ])
+        return lambda: f(0)
+
+    return setup
+
+def _seq_depth_compiled(n):
+    def setup():
+        from phi import P, Seq
+
+        f = Seq(*[ P + 1 for _ in range(n) ]).Compile()
+        return lambda: f(0)
+
+    return setup
+
+def _list_fanout(n):
+    def setup():
+        from phi import P, List
+
+        f = List(*[ P + i for i in range(n) ])
+        return lambda: f(0)
+
+    return setup
+
+def _dict_fanout(n):
+    def setup():
+        from phi import P, Dict
+
+        f = Dict(**{ "k{0}".format(i): P + i for i in range(n) })
+        return lambda: f(0)
+
+    return setup
+
+def _write_read(n):
+    def setup():
+        from phi import P, Seq, Write, Read
+
+        f = Seq(*[ Seq(P + 1, Write(**{ "r{0}".format(i): P })) for i in range(n) ] + [ Read.r0 ])
+        return lambda: f(0)
+
+    return setup
+
+def _fmap_chain(n):
+    def setup():
+        from phi import P
+
+        f = P
+
+        for i in range(n):
+            f = (f + i) * 1
+
+        return lambda: f(0)
+
+    return setup
+
+for _n in (1, 10, 100):
+    benchmark("seq_depth_{0}".format(_n))(_seq_depth(_n))
+    benchmark("seq_depth_{0}_compiled".format(_n))(_seq_depth_compiled(_n))
+
+for _n in (2, 16):
+    benchmark("list_fanout_{0}".format(_n))(_list_fanout(_n))
+    benchmark("dict_fanout_{0}".format(_n))(_dict_fanout(_n))
+
+for _n in (10, 100):
+    benchmark("write_read_{0}".format(_n), number=200)(_write_read(_n))
+    benchmark("fmap_chain_{0}".format(_n), number=200)(_fmap_chain(_n))
+
+@benchmark("then_at")
+def _then_at():
+    from phi import P
+
+    f = P.Then(max, 6).Then2(pow, 2).Then(divmod, 7).ThenAt(0, int, 1)
+    return lambda: f(2)
+
+@benchmark("python_builder_chain")
+def _python_builder_chain():
+    from phi import P, Obj
+
+    f = Obj.split(" ").map(len).sum()
+    return lambda: f("the quick brown fox jumps over the lazy dog")
+
+@benchmark("import_phi", number=1)
+def _import_phi():
+    # a new interpreter each time so nothing is cached in sys.modules
+    command = [ sys.executable, "-c", "import phi" ]
+    return lambda: subprocess.check_call(command)
+
+#######################
+### CLI
+#######################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog = "python -m phi.benchmarks", description = "Runs the phi micro-benchmarks")
+    parser.add_argument("--filter", default = None, help = "only run the benchmarks whose name matches this regular expression")
+    parser.add_argument("--repeat", type = int, default = 5, help = "measurements per benchmark")
+    parser.add_argument("--number", type = int, default = None, help = "calls per measurement, overrides the default of each benchmark")
+    parser.add_argument("--save", default = None, help = "store the results as JSON in this file")
+    parser.add_argument("--compare", default = None, help = "compare against the results stored in this file")
+    parser.add_argument("--threshold", type = float, default = 0.1, help = "relative slowdown reported as a regression by --compare")
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, repeat = args.repeat, number = args.number)
+
+    if args.save:
+        save(results, args.save)
+
+    if args.compare:
+        rows = compare(load(args.compare), results, threshold = args.threshold)
+        print(_table([ ("benchmark", "old", "new", "ratio", "") ] + [
+            (name, _format_time(old_time), _format_time(new_time), "{0:.2f}".format(ratio), "REGRESSION" if regressed else "")
+            for name, old_time, new_time, ratio, regressed in rows
+        ]))
+
+        return 1 if any(row[-1] for row in rows) else 0
+
+    print(_table([ ("benchmark", "best", "median") ] + [
+        (name, _format_time(stats["best"]), _format_time(stats["median"]))
+        for name, stats in results["benchmarks"].items()
+    ]))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
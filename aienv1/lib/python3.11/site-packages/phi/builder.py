@@ -17,6 +17,8 @@ import inspect
 from . import utils
 from .utils import identity
 import functools
+import os
+import zlib
 from . import dsl
 
 ######################
@@ -41,13 +43,16 @@ class Builder(dsl.Expression):
         if wrapped:
             f = functools.wraps(wrapped)(f)
 
-        fn_signature = utils.get_method_sig(f)
-        fn_docs = inspect.getdoc(f)
         name = alias if alias else f.__name__
         original_name = f.__name__ if wrapped else original_name if original_name else name
 
         f.__name__ = str(name)
-        f.__doc__ = doc if doc else ("""
+
+        if doc:
+            f.__doc__ = doc
+        elif explain:
+            fn_docs = inspect.getdoc(f)
+            f.__doc__ = ("""
 THIS METHOD IS AUTOMATICALLY GENERATED
 
     {builder_class}.{name}(*args, **kwargs)
@@ -58,7 +63,7 @@ It accepts the same arguments as `{library_path}{original_name}`. """ + explanat
 
     {fn_docs}
 
-        """).format(original_name=original_name, name=name, fn_docs=fn_docs, library_path=library_path, builder_class=cls.__name__) if explain else fn_docs
+        """).format(original_name=original_name, name=name, fn_docs=fn_docs, library_path=library_path, builder_class=cls.__name__)
 
         if name in cls.__core__:
             raise Exception("Can't add method '{0}' because its on __core__".format(name))
@@ -86,7 +91,7 @@ It accepts the same arguments as `{library_path}{original_name}`. """ + explanat
 * `wrapped=None` : if you are registering a function which wraps around another function, pass this other function through `wrapped` to get better documentation, this is specially useful is you register a bunch of functions in a for loop. Please include an `explanation` to tell how the actual function differs from the wrapped one.
 * `explanation=""` : especify any additional information for the documentation of the method being registered, you can use any of the following format tags within this string and they will be replace latter on: `{original_name}`, `{name}`, `{fn_docs}`, `{library_path}`, `{builder_class}`.
 * `method_type=identity` : by default its applied but does nothing, you might also want to register functions as `property`, `classmethod`, `staticmethod`
-* `explain=True` : decide whether or not to show any kind of explanation, its useful to set it to `False` if you are using a `Register*` decorator and will only use the function as a registered method.
+* `explain=True` : decide whether or not to show any kind of explanation, its useful to set it to `False` if you are using a `Register*` decorator and will only use the function as a registered method. If `False` the method just keeps the documentation of `f` and no documentation is generated.
 
 A main feature of `phi` is that it enables you to integrate your library or even an existing library with the DSL. You can achieve three levels of integration
 
@@ -209,15 +214,13 @@ Now the documentation for `MyBuilder.some_fun` will be a little bit nicer since
     def _RegisterAt(cls, n, f, library_path, alias=None, original_name=None, doc=None, wrapped=None, explanation="", method_type=utils.identity, explain=True, _return_type=None):
 
         _wrapped = wrapped if wrapped else f
+        _label = alias if alias else f.__name__
 
-        try:
-            @functools.wraps(f)
-            def method(self, *args, **kwargs):
-
-                kwargs['_return_type'] = _return_type
-                return self.ThenAt(n, f, *args, **kwargs)
-        except:
-            raise
+        # builds the same stage as ThenAt without going through its kwargs handling
+        @functools.wraps(f)
+        def method(self, *args, **kwargs):
+            g = dsl._then_at_stage(n, f, args, tuple(sorted(kwargs.items())), _label)
+            return self.__then__(g, _return_type=_return_type)
 
         all_args, previous_args, last_arg = _make_args_strs(n)
 
@@ -357,7 +360,7 @@ For this case you can just use `Register` which is a shortcut for `RegisterAt(1,
         return cls.RegisterAt(5, *args, **kwargs)
 
     @classmethod
-    def PatchAt(cls, n, module, method_wrapper=None, module_alias=None, method_name_modifier=utils.identity, blacklist_predicate=_False, whitelist_predicate=_True, return_type_predicate=_None, getmembers_predicate=inspect.isfunction, admit_private=False, explanation=""):
+    def PatchAt(cls, n, module, method_wrapper=None, module_alias=None, method_name_modifier=utils.identity, blacklist_predicate=_False, whitelist_predicate=_True, return_type_predicate=_None, getmembers_predicate=inspect.isfunction, admit_private=False, explanation="", explain=True, cache=None):
         """
 This classmethod lets you easily patch all of functions/callables from a module or class as methods a Builder class.
 
@@ -371,6 +374,8 @@ This classmethod lets you easily patch all of functions/callables from a module
 * `whitelist_predicate = lambda f_name: True` : A predicate that determines which functions are admitted given their name. By default it include any function. `whitelist_predicate` can also be of type list, in which case only names contained in this list will be admitted. You can use both `blacklist_predicate` and `whitelist_predicate` at the same time.
 * `return_type_predicate = lambda f_name: None` : a predicate that determines the `_return_type` of the Builder. By default it will always return `None`. See `phi.builder.Builder.ThenAt`.
 * `getmembers_predicate = inspect.isfunction` : a predicate that determines what type of elements/members will be fetched by the `inspect` module, defaults to [inspect.isfunction](https://docs.python.org/2/library/inspect.html#inspect.isfunction). See [getmembers](https://docs.python.org/2/library/inspect.html#inspect.getmembers).
+* `explain = True` : if `False` no documentation is generated for the patched methods, they just keep the documentation of the original functions. This makes patching large modules a lot faster.
+* `cache = None` : a `phi.builder.RegistrationCache` that stores the members found in `module` and the generated documentation of its methods so patching the same version of the module again e.g. in a new process is faster.
 
 **Examples**
 
@@ -420,7 +425,8 @@ The thing to notice is that with the `NumpyBuilder` we avoid the repetitive and
 
         return_type_predicate = (lambda x: _rtp) if inspect.isclass(_rtp) and issubclass(_rtp, Builder) else _rtp
         module_name = module_alias if module_alias else module.__name__ + '.'
-        patch_members = _get_patch_members(module, blacklist_predicate=blacklist_predicate, whitelist_predicate=whitelist_predicate, getmembers_predicate=getmembers_predicate, admit_private=admit_private)
+        names = cache.members(module, getmembers_predicate) if cache is not None else None
+        patch_members = _get_patch_members(module, blacklist_predicate=blacklist_predicate, whitelist_predicate=whitelist_predicate, getmembers_predicate=getmembers_predicate, admit_private=admit_private, names=names)
 
         for name, f in patch_members:
             wrapped = None
@@ -431,12 +437,121 @@ The thing to notice is that with the `NumpyBuilder` we avoid the repetitive and
             else:
                 g = f
 
-            cls.RegisterAt(n, g, module_name, wrapped=wrapped, _return_type=return_type_predicate(name), alias=method_name_modifier(name), explanation=explanation)
+            alias = method_name_modifier(name)
+            # the generated docs name the module as `module_name`
+            doc_key = "{0}.{1}/{2}/{3}/{4}".format(cls.__name__, alias if alias else name, n, module_name, zlib.crc32(explanation.encode("utf-8")))
+            doc = cache.doc(module, doc_key) if cache is not None and explain else None
+
+            cls.RegisterAt(n, g, module_name, wrapped=wrapped, _return_type=return_type_predicate(name), alias=alias, explanation=explanation, explain=explain, doc=doc)
+
+            if cache is not None and explain and doc is None:
+                cache.set_doc(module, doc_key, getattr(cls, alias if alias else name).__doc__)
+
+        if cache is not None and cache.path is not None:
+            cache.save()
 
 
 Builder.__core__ = [ name for name, f in inspect.getmembers(Builder, inspect.ismethod) ]
 
 
+#######################
+### RegistrationCache
+#######################
+
+class RegistrationCache(object):
+    """
+Cache for `phi.builder.Builder.PatchAt`. For every version of a module it stores the names of the members found by `inspect.getmembers` and the documentation generated for each patched method, which is where most of the time of patching a large module goes. If a `path` is given the cache is loaded from it and `PatchAt` saves it back as JSON after patching, so builders that patch big libraries initialise quickly in every new process
+
+    from phi import PythonBuilder
+    from phi.builder import RegistrationCache
+    import numpy as np
+
+    class NumpyBuilder(PythonBuilder):
+        pass
+
+    NumpyBuilder.PatchAt(1, np, cache=RegistrationCache("~/.cache/phi/numpy.json"))
+
+Entries are keyed by the module's name and `__version__`, so upgrading the module invalidates them. Modules without a `__version__` are not cached. Members are only cached for `getmembers_predicate`s that are named functions (e.g. `inspect.isfunction` or `callable`) and not lambdas.
+    """
+
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path) if path is not None else None
+        self._entries = {}
+        self._dirty = False
+
+        if self.path is not None and os.path.exists(self.path):
+            import json
+
+            with open(self.path) as f:
+                self._entries = json.load(f)
+
+    def _entry(self, module):
+        version = getattr(module, "__version__", None)
+
+        if not isinstance(version, str):
+            return None
+
+        key = "{0}=={1}".format(module.__name__, version)
+
+        if key not in self._entries:
+            self._entries[key] = dict(members={}, docs={})
+
+        return self._entries[key]
+
+    def members(self, module, getmembers_predicate):
+        "Returns the names of the members of `module` that satisfy `getmembers_predicate`, `None` if they can't be cached"
+        entry = self._entry(module)
+        predicate_name = getattr(getmembers_predicate, "__name__", "<lambda>")
+
+        if entry is None or predicate_name == "<lambda>":
+            return None
+
+        if predicate_name not in entry["members"]:
+            entry["members"][predicate_name] = [ name for name, _ in inspect.getmembers(module, getmembers_predicate) ]
+            self._dirty = True
+
+        return entry["members"][predicate_name]
+
+    def doc(self, module, key):
+        entry = self._entry(module)
+        return entry["docs"].get(key) if entry is not None else None
+
+    def set_doc(self, module, key, doc):
+        entry = self._entry(module)
+
+        if entry is not None and doc is not None:
+            entry["docs"][key] = doc
+            self._dirty = True
+
+    def save(self, path=None):
+        "Writes the cache as JSON to `path` or `self.path`, does nothing if `path` is `self.path` and nothing changed since it was loaded"
+        path = os.path.expanduser(path) if path is not None else self.path
+
+        if path == self.path and not self._dirty:
+            return
+
+        directory = os.path.dirname(path)
+
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        import json
+
+        tmp_path = path + ".tmp"
+
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f)
+
+        os.replace(tmp_path, path)
+
+        if path == self.path:
+            self._dirty = False
+
+    def clear(self):
+        self._entries = {}
+        self._dirty = True
+
+
 
 #######################
 # Helper functions
@@ -454,7 +569,7 @@ def _make_args_strs(n):
 
     return ", ".join(all_args + [""]), ", ".join(previous + [""]), last
 
-def _get_patch_members(module, blacklist_predicate=_NoLeadingUnderscore, whitelist_predicate=_True, _return_type=None, getmembers_predicate=inspect.isfunction, admit_private=False):
+def _get_patch_members(module, blacklist_predicate=_NoLeadingUnderscore, whitelist_predicate=_True, _return_type=None, getmembers_predicate=inspect.isfunction, admit_private=False, names=None):
 
     if type(whitelist_predicate) is list:
         whitelist = whitelist_predicate
@@ -464,6 +579,12 @@ def _get_patch_members(module, blacklist_predicate=_NoLeadingUnderscore, whiteli
         blacklist = blacklist_predicate
         blacklist_predicate = lambda x: x in blacklist or '_' == x[0] if not admit_private else False
 
+    if names is not None:
+        # names already satisfy getmembers_predicate, only fetch the admitted ones
+        return [
+            (name, getattr(module, name)) for name in names if whitelist_predicate(name) and not blacklist_predicate(name) and hasattr(module, name)
+        ]
+
     return [
         (name, f) for (name, f) in inspect.getmembers(module, getmembers_predicate) if whitelist_predicate(name) and not blacklist_predicate(name)
     ]
@@ -178,8 +178,18 @@ from .utils import identity
 from . import utils
 from abc import ABCMeta, abstractmethod
 from inspect import isclass
+import collections
+import contextvars
 import functools
+import inspect
+import itertools
 import operator
+import sys
+import threading
+import time
+import types
+
+# asyncio, concurrent.futures and pickle are imported where they are used, they would more than double the time of `import phi`
 
 ###############################
 # Expression Helpers
@@ -191,17 +201,7 @@ def _fmap(opt):
         f = self._f
         g = _parse(other)._f
 
-        def h(x, state):
-            y1, state1 = f(x, state)
-            y2, state2 = g(x, state)
-
-            y_out = opt(y1, y2)
-            state_out = utils.merge(state1, state2)
-
-            return y_out, state_out
-
-
-        return self.__unit__(h)
+        return self.__unit__(_fmap_stage(opt, f, g))
 
     return method
 
@@ -211,16 +211,7 @@ def _fmap_flip(opt):
         f = self._f
         g = _parse(other)._f
 
-        def h(x, state):
-            y2, state = g(x, state)
-            y1, state = f(x, state)
-
-            y_out = opt(y2, y1)
-
-            return y_out, state
-
-
-        return self.__unit__(h)
+        return self.__unit__(_fmap_flip_stage(opt, f, g))
 
     return method
 
@@ -237,29 +228,31 @@ class _RefProxy(object):
     """docstring for _ReadProxy."""
 
     def __getattr__(self, name):
-        return _StateContextManager.REFS[name]
+        return _REFS.get()[name]
 
     def __getitem__(self, name):
-        return _StateContextManager.REFS[name]
+        return _REFS.get()[name]
 
     def __call__(self, *args, **kwargs):
         return Ref(*args, **kwargs)
 
 _RefProxyInstance = _RefProxy()
 
-class _StateContextManager(object):
+# The refs and the `With` scope of the running call live in context variables
+# so concurrent calls in different threads or asyncio tasks don't see each other.
+_REFS = contextvars.ContextVar("phi_refs", default=None)
+_WITH_GLOBAL_CONTEXT = contextvars.ContextVar("phi_with_global_context", default=utils.NO_VALUE)
 
-    REFS = None
+class _StateContextManager(object):
 
     def __init__(self, next_refs):
-        self.previous_refs = _StateContextManager.REFS
         self.next_refs = next_refs
 
     def __enter__(self):
-        _StateContextManager.REFS = self.next_refs
+        self.token = _REFS.set(self.next_refs)
 
     def __exit__(self, *args):
-        _StateContextManager.REFS = self.previous_refs
+        _REFS.reset(self.token)
 
 
 class Ref(object):
@@ -345,9 +338,7 @@ class _ReadProxy(object):
 
     def __do__(self, name):
 
-        g = lambda z, state: (state[name], state)
-
-        return self.__builder__.__then__(g)
+        return self.__builder__.__then__(_read_stage(name))
 
 
 
@@ -361,8 +352,7 @@ class _ObjectProxy(object):
     def __getattr__(self, name):
 
         def method_proxy(*args, **kwargs):
-            f = lambda x: getattr(x, name)(*args, **kwargs)
-            return self.__builder__.__then__(utils.lift(f))
+            return self.__builder__.__then__(_obj_stage(name, args, tuple(sorted(kwargs.items()))))
 
         return method_proxy
 
@@ -373,12 +363,34 @@ class _RecordProxy(object):
         self.__builder__ = __builder__
 
     def __call__(self, attr):
-        f = utils.lift(lambda x: getattr(x, attr))
-        return self.__builder__.__then__(f)
+        return self.__builder__.__then__(_rec_stage(attr))
 
     def __getattr__ (self, attr):
-        f = utils.lift(lambda x: getattr(x, attr))
-        return self.__builder__.__then__(f)
+        return self.__builder__.__then__(_rec_stage(attr))
+
+class _StreamProxy(object):
+    """docstring for _StreamProxy."""
+
+    def __init__(self, __builder__):
+        self.__builder__ = __builder__
+
+    def map(self, expr):
+        return self.__builder__.__then__(_stream_each_stage(map, _parse(expr)._f))
+
+    def filter(self, expr):
+        return self.__builder__.__then__(_stream_each_stage(filter, _parse(expr)._f))
+
+    def batch(self, n):
+        return self.__builder__.__then__(_batch_stage(n))
+
+    def window(self, n, step=1):
+        return self.__builder__.__then__(_window_stage(n, step))
+
+    def take(self, n):
+        return self.__builder__.__then__(_take_stage(n))
+
+    def reduce(self, f, *initial):
+        return self.__builder__.__then__(_reduce_stage(f, initial))
 
 
 
@@ -391,19 +403,83 @@ class _RecordObject(dict):
     def __getattr__ (self, attr):
         return self[attr]
 
-class _WithContextManager(object):
+class MemoCache(object):
+    """
+Bounded cache used by `phi.dsl.Expression.Memo`. Entries are evicted in least recently used order once `maxsize` entries are stored (`None` means unbounded) and expire `ttl` seconds after they were created (`None` means never). It keeps count of the `hits` and `misses`.
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # the entries and the lock stay in this process
+        return (MemoCache, (self.maxsize, self.ttl))
+
+    def get(self, key):
+        "Returns `(True, value)` if `key` is cached and `(False, None)` otherwise."
+        with self._lock:
+            entry = self._entries.get(key, utils.NO_VALUE)
+
+            if entry is not utils.NO_VALUE and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = utils.NO_VALUE
+
+            if entry is utils.NO_VALUE:
+                self.misses += 1
+                return False, None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+
+            return True, entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+
+            if self.maxsize is not None:
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+    def info(self):
+        with self._lock:
+            return MemoCacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+MemoCacheInfo = collections.namedtuple("MemoCacheInfo", "hits misses maxsize currsize")
+
+def _memo_key(x):
+    "Default `Memo` key, turns the builtin unhashable containers into hashable ones"
+    if isinstance(x, (list, tuple)):
+        return (type(x).__name__,) + tuple(map(_memo_key, x))
+    elif isinstance(x, dict):
+        return ("dict", frozenset((key, _memo_key(value)) for key, value in x.items()))
+    elif isinstance(x, set):
+        return ("set", frozenset(x))
+    else:
+        return x
 
-    WITH_GLOBAL_CONTEXT = utils.NO_VALUE
+class _WithContextManager(object):
 
     def __init__(self, new_scope):
         self.new_scope = new_scope
-        self.old_scope = _WithContextManager.WITH_GLOBAL_CONTEXT
 
     def __enter__(self):
-        _WithContextManager.WITH_GLOBAL_CONTEXT = self.new_scope
+        self.token = _WITH_GLOBAL_CONTEXT.set(self.new_scope)
 
     def __exit__(self, *args):
-        _WithContextManager.WITH_GLOBAL_CONTEXT = self.old_scope
+        _WITH_GLOBAL_CONTEXT.reset(self.token)
 ###############################
 # DSL Elements
 ###############################
@@ -439,7 +515,15 @@ and piping through a function is just the same a applying the function
         f = self._f
         g = other
 
-        h = lambda x, state: g(*f(x, state))
+        if f is utils.state_identity:
+            return self.__unit__(g, **kwargs)
+
+        if _is_pure(f) and _is_pure(g):
+            h = utils.lift(utils.forward_compose2(f._pure, g._pure))
+        else:
+            h = lambda x, state: g(*f(x, state))
+
+        h._stages = _stages_of(f) + _stages_of(g)
 
         return self.__unit__(h, **kwargs)
 
@@ -451,20 +535,162 @@ and piping through a function is just the same a applying the function
         if len(return_state) == 1 and type(return_state[0]) is not bool:
             raise Exception("Invalid return state condition, got {return_state}".format(return_state=return_state))
 
+        state = utils.StateMap(state)
+
         with _StateContextManager(state):
             y, next_state = self._f(x, state)
 
-        return (y, next_state) if len(return_state) >= 1 and return_state[0] else y
+        return (y, dict(next_state)) if len(return_state) >= 1 and return_state[0] else y
 
 
     def __hash__(self):
         return hash(self._f)
 
+    def __reduce__(self):
+        """
+Expressions are pickled by their symbolic description (the stage constructors and the functions and values they were built with) and rebuilt -and compiled- when unpickled, so they can be sent to a `ProcessPoolExecutor` or any other multiprocessing or distributed executor
+
+    from concurrent.futures import ProcessPoolExecutor
+    from phi import P
+
+    f = P.Then(heavy_computation) + 1
+
+    with ProcessPoolExecutor() as pool:
+        ys = list(pool.map(f, xs))
+
+The functions and values used by the expression still have to be pickleable e.g. module level functions, lambdas are not. The executors of `ParallelList` and `ParallelDict` are not sent, the rebuilt expression uses the default thread pool, and `Memo` caches start empty.
+        """
+        return (_from_description, (type(self), _describe(self._f)))
+
 
     def F(self, expr):
         return self >> expr
 
 
+    def Compile(self, cse=False):
+        """
+`Compile` flattens the expression into an equivalent one that runs faster. Every `>>`, `Seq`, `Then*` and operator wraps the previous function in another closure, so an expression with `n` stages normally is a `n`-deep call stack. The expression
+
+    f = P + 1 >> P * 2 >> str
+    g = f.Compile()
+
+returns a `g` that behaves exactly as `f`, but all the stages of the sequence (including nested `Seq`s) are collected into a single linear list and executed by generated straight-line code, nested branches of `List`, `Dict`, `If` and `With` are compiled recursively. Stages that don't use `Read` or `Write` are called as plain functions without passing the state around. This removes the per-stage call overhead and the recursion limit on very long expressions.
+
+**Examples**
+
+    from phi import P, Seq
+
+    f = Seq(*[ P + 1 for i in range(5000) ]).Compile()
+
+    assert f(0) == 5000
+
+**Common Subexpressions**
+
+With `cse=True`, when the operands of operators or the branches of a `List` or `Dict` contain identical sub-expressions that don't use the state, `Compile` computes them only once per call. For example in
+
+    f = (P.Then(expensive) + 1) * P.Then(expensive)
+    g = f.Compile(cse=True)
+
+`g` calls `expensive` once while `f` calls it twice. Two sub-expressions are identical if they are built the same way from the same functions and values, see `phi.dsl.Expression.Graph`. Not using the state doesn't make a function deterministic, `List(Obj.pop(), Obj.pop())` pops twice but with `cse=True` it would pop once, so only enable it when the shared functions have no side effects. It is off by default so `Compile()` always behaves exactly as the original expression.
+
+Compiling is done once and the result can be called many times, you should compile expressions that are built once but executed often.
+        """
+        return self.__unit__(_compile(self._f, cse=cse))
+
+    def Graph(self):
+        """
+Returns the symbolic description of the expression as nested tuples of the form `(op, *params, *children)`, e.g.
+
+    from phi import P
+
+    assert (P + 1).Graph() == ("fmap", operator.add, ("Seq",), ("Val", 1))
+
+`("Seq", *nodes)` represents a sequence of stages, the empty `("Seq",)` is the identity. Plain functions are represented as `("Function", f)`. Two expressions that are built the same way have equal graphs.
+        """
+        return _node_of(self._f)
+
+    def Vectorize(self):
+        """
+Returns a version of an operator-only expression that is applied to a whole column of values at once, i.e. to a numpy array or pandas Series/DataFrame, instead of to a single value. The expression can only contain operators (`+`, `*`, `<`, `-`, `~`, ...), values, numpy ufuncs and item access, where `P[key]` selects a column: `x[:, key]` for 2-D arrays, `x[key]` or `x.iloc[:, key]` for DataFrames and `x[key]` for anything else (e.g. a `dict` of arrays). This replaces one Python call per element by a handful of vectorized operations.
+
+**Examples**
+
+    from phi import P
+    import numpy as np
+
+    f = (P * 6) / (P + 2)
+    g = f.Vectorize()
+
+    x = np.arange(1000000.0)
+
+    assert np.allclose(g(x), [ f(xi) for xi in x ])
+
+    rows = np.array([[1, 2, 3], [4, 5, 6]])
+
+    assert list((P[0] + P[-1]).Vectorize()(rows)) == [4, 10]
+
+An `Exception` is raised if the expression contains anything else e.g. `Then`, `List` or `Read`.
+        """
+        return self.__unit__(utils.lift(_vectorize(_node_of(self._f))))
+
+    def Trace(self, sample, **state):
+        """
+Runs `sample` through the expression and returns a version of it specialised for the path that was taken. The stages that don't use the state are generated as straight-line python code where
+
+* operators are written as such e.g. `x + 1` instead of calling `operator.add`,
+* `Val`s, the arguments of `Then*` and registered methods are inlined as constants,
+* `If`/`Elif`/`Else`, `And` and `Or` only contain the branches that were taken,
+* `Obj` methods of builtin types (e.g. `Obj.split` over a `str`) are called through the type instead of looked up on every call.
+
+Each of those decisions is guarded, if an input takes another branch or has another type the guarded sub-expression falls back to its generic version, reusing the values already computed, so the result is always the same and no function is called twice. Stages that use the state are called as usual.
+
+    from phi import P, Obj, If
+
+    f = Obj.split(" ").map(len) >> sum >> If(P > 10, "long").Else("short")
+    g = f.Trace("hello world")
+
+    assert g("hi there") == "short"
+    assert g("hello wonderful world") == "long"  # falls back to the generic Else branch
+
+Tracing pays off for hot expressions called many times with similar inputs, use `phi.dsl.Expression.Compile` otherwise. The functions of the expression are called once on `sample` when tracing, `**state` are the refs used for it.
+        """
+        return self.__unit__(_trace(self._f, sample, state))
+
+    def Profile(self, profiler=None):
+        """
+Returns an instrumented version of the expression that records the call count, cumulative wall time and input/output sizes of every stage in a `phi.profiler.Profiler`. The instrumented expression has a `Profiler` attribute, you can also pass a `profiler` to collect the stats of many expressions in one place.
+
+**Examples**
+
+    from phi import P, Obj
+
+    f = (Obj.split(' ').map(len) >> sum).Profile()
+
+    f("hello world")
+
+    print(f.Profiler.table())
+
+Prints something like
+
+    path  stage      calls  time (s)  mean (s)  in size  out size
+    0     Obj.split  1      0.000002  0.000002  11.0     2.0
+    1     map        1      0.000001  0.000001  2.0      1.0
+    2     sum        1      0.000001  0.000001  1.0      1.0
+
+**Also see**
+
+* `phi.profiler.Profiler`
+        """
+        from .profiler import Profiler, instrument
+
+        profiler = profiler if profiler is not None else Profiler()
+
+        expr = self.__unit__(instrument(self._f, profiler))
+        expr.Profiler = profiler
+
+        return expr
+
+
     def Pipe(self, *sequence, **kwargs):
         """
 `Pipe` runs any `phi.dsl.Expression`. Its highly inspired by Elixir's [|> (pipe)](https://hexdocs.pm/elixir/Kernel.html#%7C%3E/2) operator.
@@ -521,6 +747,72 @@ The previous using [lambdas](https://cgarciae.github.io/phi/lambdas.m.html) to c
         state = kwargs.pop("refs", {})
         return self.Seq(*sequence, **kwargs)(None, **state)
 
+    async def ACall(self, __x__, *__return_state__, **state):
+        """
+`ACall` is the asynchronous version of `__call__`, it accepts the same arguments but returns a coroutine. Whenever a stage returns an awaitable (e.g. calling an `async def` function) it is awaited before its result is passed to the next stage, and the branches of `phi.dsl.Expression.List`, `phi.dsl.Expression.Tuple`, `phi.dsl.Expression.Set` and `phi.dsl.Expression.Dict` are executed concurrently with `asyncio.gather`.
+
+Since the branches run concurrently each of them receives the state as it was before the branching, so a branch can't `Read` a reference `Write`n by one of its siblings. The changes to the state made by each branch are merged in the order of the branches.
+
+**Examples**
+
+    import asyncio
+    from phi import P, List
+
+    async def fetch(url):
+        await asyncio.sleep(1)
+        return url.upper()
+
+    f = List(
+        P + "/a" >> fetch
+    ,
+        P + "/b" >> fetch
+    )
+
+    ys = asyncio.run(f.ACall("http://example.com"))  # takes 1 second instead of 2
+
+    assert ys == ["HTTP://EXAMPLE.COM/A", "HTTP://EXAMPLE.COM/B"]
+
+**Also see**
+
+* `phi.dsl.Expression.APipe`
+        """
+        x = __x__
+        return_state = __return_state__
+
+        if len(return_state) == 1 and type(return_state[0]) is not bool:
+            raise Exception("Invalid return state condition, got {return_state}".format(return_state=return_state))
+
+        if "_af" not in self.__dict__:
+            self._af = _async(self._f)
+
+        state = utils.StateMap(state)
+
+        with _StateContextManager(state):
+            y, next_state = await self._af(x, state)
+
+        return (y, dict(next_state)) if len(return_state) >= 1 and return_state[0] else y
+
+    def APipe(self, *sequence, **kwargs):
+        """
+`APipe` is the asynchronous version of `phi.dsl.Expression.Pipe`, it returns a coroutine which runs the expression using `phi.dsl.Expression.ACall`.
+
+**Examples**
+
+    import asyncio
+    from phi import P
+
+    async def add1(x):
+        return x + 1
+
+    assert 4 == asyncio.run(P.APipe(
+        1,
+        add1,  #1 + 1 == 2
+        P * 2  #2 * 2 == 4
+    ))
+        """
+        state = kwargs.pop("refs", {})
+        return self.Seq(*sequence, **kwargs).ACall(None, **state)
+
     def ThenAt(self, n, f, *_args, **kwargs):
         """
 `ThenAt` enables you to create a partially apply many arguments to a function, the returned partial expects a single arguments which will be applied at the `n`th position of the original function.
@@ -623,17 +915,17 @@ As you see, `Then2` was very useful because `map` accepts and `iterable` as its
 * `phi.builder.Builder.RegisterAt`
         """
         _return_type = None
-        n_args = n - 1
+        _label = getattr(f, "__name__", None) or repr(f)
 
         if '_return_type' in kwargs:
             _return_type = kwargs['_return_type']
             del kwargs['_return_type']
 
-        @utils.lift
-        def g(x):
+        if '_label' in kwargs:
+            _label = kwargs['_label']
+            del kwargs['_label']
 
-            new_args = _args[0:n_args] + (x,) + _args[n_args:] if n_args >= 0 else _args
-            return f(*new_args, **kwargs)
+        g = _then_at_stage(n, f, _args, tuple(sorted(kwargs.items())), _label)
 
         return self.__then__(g, _return_type=_return_type)
 
@@ -782,15 +1074,51 @@ Check out the documentatio for Phi [lambdas](https://cgarciae.github.io/phi/lamb
         """
         gs = [ _parse(code)._f for code in branches ]
 
-        def h(x, state):
-            ys = []
-            for g in gs:
-                y, state = g(x, state)
-                ys.append(y)
+        return self.__then__(_list_stage(*gs), **kwargs)
 
-            return (ys, state)
+    def And(self, *branches, **kwargs):
+        """
+**And**
+
+    And(*branches)
+
+Short-circuit version of python's `and` over expressions, the branches are evaluated in order with the same input and the first one whose result is falsy is returned, the rest are never evaluated. If all are truthy the result of the last branch is returned. Unlike `&` -which evaluates both sides- this lets you guard an expensive expression e.g. a tool call or a database lookup
+
+    from phi import P, And
+
+    f = And(P > 0, P.Then(expensive_lookup))
+
+    assert 0 == f(0) #expensive_lookup is never called
+
+The state written by a branch is visible to the following branches.
+
+**Also See**
+
+* `phi.dsl.Expression.Or`
+        """
+        gs = [ _parse(code)._f for code in branches ]
+
+        return self.__then__(_short_circuit_stage(False, *gs), **kwargs)
+
+    def Or(self, *branches, **kwargs):
+        """
+**Or**
+
+    Or(*branches)
+
+Short-circuit version of python's `or` over expressions, returns the result of the first branch that is truthy without evaluating the rest, if none is the result of the last branch is returned
 
-        return self.__then__(h, **kwargs)
+    from phi import P, Or
+
+    f = Or(P["cached"], P.Then(expensive_lookup))
+
+**Also See**
+
+* `phi.dsl.Expression.And`
+        """
+        gs = [ _parse(code)._f for code in branches ]
+
+        return self.__then__(_short_circuit_stage(True, *gs), **kwargs)
 
     def Tuple(self, *expressions, **kwargs):
         return self.List(*expressions) >> tuple
@@ -863,24 +1191,67 @@ The previous example using `P.Pipe`
         """
         fs = [ _parse(elem)._f for elem in sequence ]
 
-        def g(x, state):
-            return functools.reduce(lambda args, f: f(*args), fs, (x, state))
+        if all(map(_is_pure, fs)):
+            ps = [ f._pure for f in fs ]
+
+            def _g(x):
+                for p in ps:
+                    x = p(x)
+                return x
+
+            g = utils.lift(_g)
+        else:
+            def g(x, state):
+                return functools.reduce(lambda args, f: f(*args), fs, (x, state))
+
+        g._stages = sum(map(_stages_of, fs), ())
 
         return self.__then__(g, **kwargs)
 
     def Dict(self, **branches):
-        gs = { key : _parse(value)._f for key, value in branches.items() }
+        keys = tuple(branches.keys())
+        gs = [ _parse(branches[key])._f for key in keys ]
 
-        def h(x, state):
-            ys = {}
+        return self.__then__(_dict_stage(keys, *gs))
 
-            for key, g in gs.items():
-                y, state = g(x, state)
-                ys[key] = y
+    def ParallelList(self, *branches, **kwargs):
+        """
+Same as `phi.dsl.Expression.List` but the branches are executed in parallel on a [concurrent.futures](https://docs.python.org/3/library/concurrent.futures.html) executor. The results are returned in the order of the branches.
 
-            return _RecordObject(**ys), state
+**Arguments**
+
+* ***branches**: the expressions of each branch, see `phi.dsl.Expression.List`.
+* `executor = None`: a `ThreadPoolExecutor` or `ProcessPoolExecutor` used to run the branches. If `None` a thread pool shared by all parallel expressions is used.
+
+Use a thread pool for I/O bound branches and a process pool for CPU bound branches, in the later case the branches are sent to the workers as described in `phi.dsl.Expression.__reduce__` so the functions and values they use have to be pickleable. Since the branches run at the same time each of them receives the state as it was before the branching, so a branch can't `Read` a reference `Write`n by one of its siblings. The changes to the state made by each branch are merged in the order of the branches.
+
+**Examples**
+
+    from concurrent.futures import ThreadPoolExecutor
+    from phi import P
+
+    with ThreadPoolExecutor(4) as pool:
+        f = P.ParallelList(
+            P.Then(download, "a.csv"),
+            P.Then(download, "b.csv"),
+            executor = pool
+        )
+
+        a, b = f(None)
+        """
+        executor = kwargs.pop("executor", None)
+        gs = [ _parse(code)._f for code in branches ]
+
+        return self.__then__(_parallel_list_stage(executor, *gs), **kwargs)
+
+    def ParallelDict(self, executor=None, **branches):
+        """
+Same as `phi.dsl.Expression.Dict` but the branches are executed in parallel, see `phi.dsl.Expression.ParallelList`.
+        """
+        keys = tuple(branches.keys())
+        gs = [ _parse(branches[key])._f for key in keys ]
 
-        return self.__then__(h)
+        return self.__then__(_parallel_dict_stage(executor, keys, *gs))
 
 
     @property
@@ -964,13 +1335,7 @@ The previous is equivalent to
         context_f = _parse(context_manager)._f
         body_f = E.Seq(*body)._f
 
-        def g(x, state):
-            context, state = context_f(x, state)
-            with context as scope:
-                with _WithContextManager(scope):
-                    return body_f(x, state)
-
-        return self.__then__(g, **kwargs)
+        return self.__then__(_with_stage(context_f, body_f), **kwargs)
 
 
     @property
@@ -1048,17 +1413,7 @@ Same as `phi.dsl.Expression.List` but any string argument `x` is translated to `
 
 
 
-        def g(x, state):
-            update = { key: x for key in state_args }
-            state = utils.merge(state, update)
-
-            #side effect for convenience
-            _StateContextManager.REFS.update(state)
-
-            return x, state
-
-
-        return expr.__then__(g)
+        return expr.__then__(_write_stage(state_args))
 
     @property
     def Rec(self):
@@ -1101,6 +1456,43 @@ is equivalent to
         """
         return _RecordProxy(self)
 
+    @property
+    def Stream(self):
+        """
+`Stream` is a `property` that returns an object with combinators that process an iterable lazily, each of them returns a generator so the elements flow one at a time through the whole pipeline instead of materializing a `list` at every step. This lets you process huge files or database cursors in constant memory.
+
+* `Stream.map(f)` : applies the expression `f` to each element.
+* `Stream.filter(f)` : keeps the elements for which the expression `f` is truthy.
+* `Stream.batch(n)` : groups the elements into lists of `n` elements, the last one can be shorter.
+* `Stream.window(n, step=1)` : sliding tuples of `n` consecutive elements, advancing `step` elements each time. `n` and `step` (and the `n` of `batch`) have to be at least `1`, otherwise a `ValueError` is raised.
+* `Stream.take(n)` : only the first `n` elements.
+* `Stream.reduce(f, *initial)` : consumes the stream with `functools.reduce`.
+
+Since the elements are evaluated when the stream is consumed, a `Write` inside `Stream.map` or `Stream.filter` doesn't change the state seen by the rest of the expression.
+
+**Examples**
+
+    from phi import P, Obj, Stream
+
+    longest_line = P.Pipe(
+        open("big.txt"),
+        Stream.map(Obj.strip()),
+        Stream.filter(P != ""),
+        Stream.map(len),
+        Stream.reduce(max)
+    )
+
+Sum of every consecutive pair
+
+    assert [3, 5, 7] == P.Pipe(
+        range(1, 5),
+        Stream.window(2),
+        Stream.map(sum),
+        list
+    )
+        """
+        return _StreamProxy(self)
+
     @property
     def Obj(self):
         """
@@ -1198,10 +1590,46 @@ is equivalent to
 
 The previous expression as a whole is a constant function since it will return `2` no matter what input you give it.
         """
-        f = utils.lift(lambda z: val)
+        return self.__then__(_val_stage(val), **kwargs)
+
+
+    def Memo(self, expr, maxsize=128, ttl=None, key=None, cache=None, **kwargs):
+        """
+**Memo**
+
+    Memo(expr, maxsize=128, ttl=None, key=None, cache=None)
+
+Returns an expression equivalent to `expr` that remembers its results, if it receives an input it has seen before (according to `key`) it returns the previous result instead of executing `expr` again. Useful for expensive stages like tool calls, searches or embeddings.
+
+**Arguments**
+
+* **expr** : the expression being memoized.
+* `maxsize=128` : maximum number of cached results, the least recently used is evicted first. `None` means unbounded.
+* `ttl=None` : seconds a result stays valid. `None` means forever.
+* `key=None` : a function that maps the input to the hashable cache key. By default the input itself is used, `list`s, `tuple`s, `dict`s and `set`s are converted to hashable values.
+* `cache=None` : a `phi.dsl.MemoCache` to use, lets many expressions share the same cache. By default a new one is created with `maxsize` and `ttl`.
+
+If `expr` writes to the state the written references are remembered and also applied on a cache hit. The state is not part of the key, if the result of `expr` depends on what it `Read`s include it in the `key`. The returned expression has a `Cache` attribute with the `phi.dsl.MemoCache`, use `Cache.info()` to get the hit and miss counters. The attribute is not kept when the expression is chained further (e.g. `P.Memo(f) >> g`), keep a reference to the expression or pass your own `cache` in that case.
+
+**Examples**
+
+    from phi import P
+
+    embed = P.Memo(get_embedding, maxsize=10000, ttl=3600)
+
+    embed("hello")
+    embed("hello")  # cached
+
+    assert embed.Cache.info().hits == 1
+        """
+        cache = cache if cache is not None else MemoCache(maxsize=maxsize, ttl=ttl)
+        key = key if key is not None else _memo_key
+        f = _parse(expr)._f
 
-        return self.__then__(f, **kwargs)
+        memo = self.__then__(_memo_stage(cache, key, f), **kwargs)
+        memo.Cache = cache
 
+        return memo
 
     def If(self, condition, *then, **kwargs):
         """
@@ -1335,10 +1763,12 @@ Here we called `Context` with no arguments to get the context back, however, sin
 * `phi.builder.Builder.Obj`
 * [dsl](https://cgarciae.github.io/phi/dsl.m.html)
         """
-        if _WithContextManager.WITH_GLOBAL_CONTEXT is utils.NO_VALUE:
+        scope = _WITH_GLOBAL_CONTEXT.get()
+
+        if scope is utils.NO_VALUE:
             raise Exception("Cannot use 'Context' outside of a 'With' block")
 
-        return _WithContextManager.WITH_GLOBAL_CONTEXT
+        return scope
 
 
     ###############
@@ -1370,7 +1800,15 @@ Here we called `Context` with no arguments to get the context back, however, sin
         f = self._f
         g = other
 
-        h = lambda x, state: g(*f(x, state))
+        if f is utils.state_identity:
+            return self.__unit__(g, **kwargs)
+
+        if _is_pure(f) and _is_pure(g):
+            h = utils.lift(utils.forward_compose2(f._pure, g._pure))
+        else:
+            h = lambda x, state: g(*f(x, state))
+
+        h._stages = _stages_of(f) + _stages_of(g)
 
         return self.__unit__(h, **kwargs)
 
@@ -1382,17 +1820,18 @@ Here we called `Context` with no arguments to get the context back, however, sin
         if len(return_state) == 1 and type(return_state[0]) is not bool:
             raise Exception("Invalid return state condition, got {return_state}".format(return_state=return_state))
 
+        state = utils.StateMap(state)
+
         with _StateContextManager(state):
             y, next_state = self._f(x, state)
 
-        return (y, next_state) if len(return_state) >= 1 and return_state[0] else y
+        return (y, dict(next_state)) if len(return_state) >= 1 and return_state[0] else y
 
 
 
 
     def __getitem__(self, key):
-        f = utils.lift(lambda x: x[key])
-        return self.__then__(f)
+        return self.__then__(_getitem_stage(key))
 
 
 
@@ -1456,20 +1895,790 @@ def _add_else(ast, next_else):
 
 
 def _compile_if(ast):
-    if hasattr(ast, "__call__"):
+    "Flattens the nested `(cond, then, Else)` ast of an `If`/`Elif`/`Else` chain into the children `cond1, then1, cond2, then2, ..., Else` of a single stage"
+    children = []
+
+    while not hasattr(ast, "__call__"):
+        cond, then, ast = ast
+        children += [cond, then]
+
+    if not children:
         return ast
 
-    cond, then, Else = ast
+    return _if_stage(*(children + [ast]))
+
+###############################
+# Stages
+###############################
+
+def _stages_of(f):
+    return getattr(f, "_stages", (f,))
+
+def _leaf(f, label, *node):
+    "Sets the name used to identify the stage `f` e.g. by `phi.dsl.Expression.Profile` and its symbolic `node`"
+    f._label = label
+    f._node = node
+    return f
+
+def _describe(f):
+    "Pickleable description of the stage function `f` from which `_build` creates an equivalent one, see `phi.dsl.Expression.__reduce__`"
+    stages = [ stage for stage in _stages_of(f) if stage is not utils.state_identity ]
+
+    if len(stages) != 1:
+        return ("Seq",) + tuple(map(_describe, stages))
+
+    stage = stages[0]
+
+    if hasattr(stage, "_rebuild"):
+        rebuild = stage._rebuild
+
+        # executors can't be sent to another process
+        if stage._head[0] == "ParallelList":
+            rebuild = functools.partial(_parallel_list_stage, None)
+        elif stage._head[0] == "ParallelDict":
+            rebuild = functools.partial(_parallel_dict_stage, None, stage._head[2])
+
+        return ("Rebuild", rebuild) + tuple(map(_describe, stage._children))
+
+    elif hasattr(stage, "_node") and stage._node[0] in _LEAF_STAGES:
+        return stage._node
+
+    elif hasattr(stage, "_node") and hasattr(stage, "_leaf_stage"):
+        # leaf stages defined by other modules e.g. `phi.numpy_builder`, rebuilt by their module level function
+        return ("Leaf", stage._leaf_stage) + stage._node[1:]
+
+    elif _is_pure(stage):
+        return ("Function", stage._pure)
+
+    else:
+        return ("Stage", stage)
+
+def _build(description):
+    "Inverse of `_describe`"
+    op = description[0]
+
+    if op == "Seq":
+        return _compile_stages([ _build(child) for child in description[1:] ])
+    elif op == "Rebuild":
+        return description[1](*[ _build(child) for child in description[2:] ])
+    elif op == "Function":
+        return utils.lift(description[1])
+    elif op == "Stage":
+        return description[1]
+    elif op == "Leaf":
+        return description[1](*description[2:])
+    else:
+        return _LEAF_STAGES[op](*description[1:])
+
+def _from_description(cls, description):
+    return cls(_build(description))
+
+def _label_of(f):
+    if hasattr(f, "_label"):
+        return f._label
+
+    f = getattr(f, "_pure", f)
+
+    return getattr(f, "__name__", None) or repr(f)
+
+def _node_of(f):
+    "Symbolic description of the stage function `f`, see `phi.dsl.Expression.Graph`"
+    stages = [ stage for stage in _stages_of(f) if stage is not utils.state_identity ]
+
+    if len(stages) == 1:
+        stage = stages[0]
+
+        if hasattr(stage, "_head"):
+            return stage._head + tuple(map(_node_of, stage._children))
+        elif hasattr(stage, "_node"):
+            return stage._node
+        else:
+            return ("Function", getattr(stage, "_pure", stage))
+
+    return ("Seq",) + tuple(map(_node_of, stages))
+
+def _node_key(node):
+    "Hashable key of a node that also distinguishes values by type e.g. `Val(1)` from `Val(True)`, `None` if its not hashable"
+    def typed(value):
+        if type(value) is tuple:
+            return tuple(map(typed, value))
+        else:
+            return (type(value), value)
+
+    key = typed(node)
+
+    try:
+        hash(key)
+    except TypeError:
+        return None
+
+    return key
+
+_VECTORIZED_FUNCTIONS = (operator.neg, operator.pos, operator.invert)
+
+def _vectorize(node):
+    "Builds a function from the operator-only `node` that works over whole columns, see `phi.dsl.Expression.Vectorize`"
+    op = node[0]
+
+    if op == "Seq":
+        fs = tuple(map(_vectorize, node[1:]))
+
+        def f(x):
+            for g in fs:
+                x = g(x)
+            return x
+
+        return f
+
+    elif op == "fmap":
+        opt, f, g = node[1], _vectorize(node[2]), _vectorize(node[3])
+        return lambda x: opt(f(x), g(x))
+
+    elif op == "fmap_flip":
+        opt, f, g = node[1], _vectorize(node[2]), _vectorize(node[3])
+        return lambda x: opt(g(x), f(x))
+
+    elif op == "Val":
+        val = node[1]
+        return lambda x: val
+
+    elif op == "GetItem":
+        key = node[1]
+        return lambda x: _column(x, key)
+
+    elif op == "Function" and (node[1] in _VECTORIZED_FUNCTIONS or type(node[1]).__name__ == "ufunc"):
+        return node[1]
+
+    else:
+        raise Exception("Can't vectorize '{0}', only operators, values, ufuncs and item access are supported".format(op))
+
+def _column(x, key):
+    if getattr(x, "ndim", 0) > 1 and hasattr(x, "iloc"):
+        return x[key] if key in x.columns else x.iloc[:, key]
+    elif getattr(x, "ndim", 0) > 1:
+        return x[:, key]
+    else:
+        return x[key]
+
+def _getitem_stage(key):
+    return _leaf(utils.lift(lambda x: x[key]), "[{0!r}]".format(key), "GetItem", key)
+
+def _val_stage(val):
+    return _leaf(utils.lift(lambda z: val), "Val", "Val", val)
+
+def _obj_stage(name, args, kwargs_items):
+    kwargs = dict(kwargs_items)
+    f = lambda x: getattr(x, name)(*args, **kwargs)
+
+    return _leaf(utils.lift(f), "Obj." + name, "Obj", name, args, kwargs_items)
+
+def _rec_stage(attr):
+    return _leaf(utils.lift(lambda x: getattr(x, attr)), "Rec." + attr, "Rec", attr)
+
+def _read_stage(name):
+    g = lambda z, state: (state[name], state)
+
+    return _leaf(g, "Read." + name, "Read", name)
+
+def _write_stage(state_args):
+    def g(x, state):
+        state = state.merge({ key: x for key in state_args })
+
+        # makes the new refs visible to `Ref.name` for the rest of the call
+        _REFS.set(state)
+
+        return x, state
+
+    return _leaf(g, "Write({0})".format(", ".join(map(str, state_args))), "Write", state_args)
+
+def _then_at_stage(n, f, _args, kwargs_items, label):
+    g = utils.lift(_then_at_partial(n, f, _args, dict(kwargs_items)))
+    return _leaf(g, label, "ThenAt", n, f, _args, kwargs_items, label)
+
+def _then_at_partial(n, f, _args, kwargs):
+    "The `x -> f(...)` function of `ThenAt`, `x` is placed at its position in the argument list once here instead of on every call"
+    if n <= 0:
+        return _then_at_factory(-1, len(_args), bool(kwargs))(f, _args, kwargs)
+
+    n_args = min(n - 1, len(_args))
+
+    if n_args == 0 and not _args and not kwargs:
+        return f
+
+    return _then_at_factory(n_args, len(_args), bool(kwargs))(f, _args, kwargs)
+
+@functools.lru_cache(maxsize=None)
+def _then_at_factory(n_args, n_total, has_kwargs):
+    "Generates and caches a `make(f, args, kwargs)` for each arity, the partial it returns calls `f` with every argument bound to a local"
+    names = [ "_a{0}".format(i) for i in range(n_total) ]
+    call_args = names[:n_args] + ["x"] + names[n_args:] if n_args >= 0 else list(names)
+
+    if has_kwargs:
+        call_args.append("**_kwargs")
+
+    source = (
+        "def make(f, _args, _kwargs):\n"
+        "    {unpack}\n"
+        "    def g(x):\n"
+        "        return f({call_args})\n"
+        "    return g\n"
+    ).format(
+        unpack = "{0}, = _args".format(", ".join(names)) if names else "pass",
+        call_args = ", ".join(call_args)
+    )
+
+    namespace = {}
+    exec(compile(source, "<phi.dsl.ThenAt>", "exec"), namespace)
+
+    return namespace["make"]
+
+def _stream_each_stage(fn, f):
+    if _is_pure(f):
+        p = f._pure
+        g = utils.lift(lambda it: fn(p, it))
+    else:
+        g = lambda it, state: (fn(lambda y: f(y, state)[0], it), state)
+
+    g._label = "Stream." + fn.__name__
+    g._head = ("StreamEach", fn)
+    g._children = (f,)
+    g._rebuild = functools.partial(_stream_each_stage, fn)
+
+    return g
+
+def _check_positive(name, **values):
+    for key, value in values.items():
+        if value < 1:
+            raise ValueError("{0}: '{1}' has to be at least 1, got {2}".format(name, key, value))
+
+def _batch_stage(n):
+    _check_positive("Stream.batch", n = n)
+
+    return _leaf(utils.lift(lambda it: utils.batch(it, n)), "Stream.batch", "StreamBatch", n)
+
+def _window_stage(n, step):
+    _check_positive("Stream.window", n = n, step = step)
+
+    return _leaf(utils.lift(lambda it: utils.window(it, n, step=step)), "Stream.window", "StreamWindow", n, step)
+
+def _take_stage(n):
+    return _leaf(utils.lift(lambda it: itertools.islice(it, n)), "Stream.take", "StreamTake", n)
+
+def _reduce_stage(f, initial):
+    return _leaf(utils.lift(lambda it: functools.reduce(f, it, *initial)), "Stream.reduce", "StreamReduce", f, initial)
+
+_LEAF_STAGES = dict(
+    GetItem = _getitem_stage,
+    Val = _val_stage,
+    Obj = _obj_stage,
+    Rec = _rec_stage,
+    Read = _read_stage,
+    Write = _write_stage,
+    ThenAt = _then_at_stage,
+    StreamBatch = _batch_stage,
+    StreamWindow = _window_stage,
+    StreamTake = _take_stage,
+    StreamReduce = _reduce_stage,
+)
+
+def _is_pure(f):
+    "A stage is pure if it doesn't touch the state, its `_pure` attribute is then the plain `x -> y` function"
+    return hasattr(f, "_pure")
+
+def _fmap_stage(opt, f, g):
+    if _is_pure(f) and _is_pure(g):
+        fp, gp = f._pure, g._pure
+        h = utils.lift(lambda x: opt(fp(x), gp(x)))
+
+    elif _is_pure(f):
+        fp = f._pure
+
+        def h(x, state):
+            y1 = fp(x)
+            y2, state = g(x, state)
+
+            return opt(y1, y2), state
+
+    else:
+        def h(x, state):
+            y1, state1 = f(x, state)
+            y2, state2 = g(x, state)
+
+            return opt(y1, y2), _merge_branch_states(state, [state1, state2])
+
+    h._label = opt.__name__
+    h._head = ("fmap", opt)
+    h._children = (f, g)
+    h._rebuild = functools.partial(_fmap_stage, opt)
+    h._arebuild = functools.partial(_afmap_stage, opt)
+
+    return h
+
+def _fmap_flip_stage(opt, f, g):
+    if _is_pure(f) and _is_pure(g):
+        fp, gp = f._pure, g._pure
+        h = utils.lift(lambda x: opt(gp(x), fp(x)))
+
+    else:
+        def h(x, state):
+            y2, state = g(x, state)
+            y1, state = f(x, state)
+
+            y_out = opt(y2, y1)
+
+            return y_out, state
+
+    h._label = opt.__name__
+    h._head = ("fmap_flip", opt)
+    h._children = (f, g)
+    h._rebuild = functools.partial(_fmap_flip_stage, opt)
+    h._arebuild = functools.partial(_afmap_flip_stage, opt)
+
+    return h
+
+def _list_stage(*gs):
+    if all(map(_is_pure, gs)):
+        ps = [ g._pure for g in gs ]
+        h = utils.lift(lambda x: [ p(x) for p in ps ])
+
+    else:
+        def h(x, state):
+            ys = []
+            for g in gs:
+                y, state = g(x, state)
+                ys.append(y)
+
+            return (ys, state)
+
+    h._label = "List"
+    h._head = ("List",)
+    h._children = gs
+    h._rebuild = _list_stage
+    h._arebuild = _alist_stage
+
+    return h
+
+def _short_circuit_stage(stop, *gs):
+    "`And` (`stop=False`) and `Or` (`stop=True`), the branches after the first one whose truth value is `stop` are never evaluated"
+    if all(map(_is_pure, gs)):
+        ps = tuple( g._pure for g in gs )
+
+        @utils.lift
+        def h(x):
+            y = None
+
+            for p in ps:
+                y = p(x)
+
+                if bool(y) is stop:
+                    break
+
+            return y
+
+    else:
+        def h(x, state):
+            y = None
+
+            for g in gs:
+                y, state = g(x, state)
+
+                if bool(y) is stop:
+                    break
+
+            return y, state
+
+    h._label = "Or" if stop else "And"
+    h._head = (h._label,)
+    h._children = gs
+    h._rebuild = functools.partial(_short_circuit_stage, stop)
+    h._arebuild = functools.partial(_ashort_circuit_stage, stop)
+
+    return h
+
+def _dict_stage(keys, *gs):
+    if all(map(_is_pure, gs)):
+        ps = [ g._pure for g in gs ]
+        h = utils.lift(lambda x: _RecordObject(zip(keys, [ p(x) for p in ps ])))
+
+    else:
+        def h(x, state):
+            ys = {}
+
+            for key, g in zip(keys, gs):
+                y, state = g(x, state)
+                ys[key] = y
+
+            return _RecordObject(**ys), state
+
+    h._label = "Dict"
+    h._head = ("Dict", keys)
+    h._children = gs
+    h._rebuild = functools.partial(_dict_stage, keys)
+    h._arebuild = functools.partial(_adict_stage, keys)
+
+    return h
+
+def _state_delta(state, new_state):
+    return new_state.delta(state) if new_state is not state else {}
+
+def _merge_branch_states(state, states):
+    "Merges the changes each branch made to `state`, later branches win"
+    delta = {}
+
+    for branch_state in states:
+        delta.update(_state_delta(state, branch_state))
+
+    if not delta:
+        return state
+
+    state = state.merge(delta)
+    _REFS.set(state)
+
+    return state
+
+# the entries of a `MemoCache` are `(y, delta)` for all Memo stages so they can share it, pure stages don't change the refs
+_NO_DELTA = {}
+
+def _memo_stage(cache, key_fn, f):
+    if _is_pure(f):
+        p = f._pure
+
+        def _h(x):
+            key = key_fn(x)
+            found, entry = cache.get(key)
+
+            if found:
+                return entry[0]
+
+            y = p(x)
+            cache.put(key, (y, _NO_DELTA))
+
+            return y
+
+        h = utils.lift(_h)
+
+    else:
+        def h(x, state):
+            key = key_fn(x)
+            found, entry = cache.get(key)
+
+            if found:
+                y, delta = entry
+
+                if delta:
+                    state = state.merge(delta)
+                    _REFS.set(state)
+
+                return y, state
+
+            y, new_state = f(x, state)
+            cache.put(key, (y, _state_delta(state, new_state)))
+
+            return y, new_state
+
+    h._label = "Memo"
+    h._head = ("Memo", cache, key_fn)
+    h._children = (f,)
+    h._rebuild = functools.partial(_memo_stage, cache, key_fn)
+    h._arebuild = functools.partial(_amemo_stage, cache, key_fn, _is_pure(f))
+
+    return h
+
+_DEFAULT_EXECUTOR = None
+_DEFAULT_EXECUTOR_LOCK = threading.Lock()
+
+def _default_executor():
+    global _DEFAULT_EXECUTOR
+    from concurrent import futures
+
+    with _DEFAULT_EXECUTOR_LOCK:
+        if _DEFAULT_EXECUTOR is None:
+            _DEFAULT_EXECUTOR = futures.ThreadPoolExecutor(thread_name_prefix="phi")
+
+    return _DEFAULT_EXECUTOR
+
+# set while a branch runs on a pool thread
+_POOL_WORKER = threading.local()
+
+def _call_on_worker(g, x, state):
+    _POOL_WORKER.active = True
+
+    try:
+        return g(x, state)
+    finally:
+        _POOL_WORKER.active = False
+
+def _call_with_refs(g, x, state):
+    with _StateContextManager(state):
+        return g(x, state)
+
+def _branch_payloads(executor, gs):
+    "The branches sent to a process pool, described and pickled once when the stage is built instead of on every call"
+    # if concurrent.futures isn't loaded yet `executor` can't be a process pool
+    futures = sys.modules.get("concurrent.futures")
+
+    if futures is not None and isinstance(executor, futures.ProcessPoolExecutor):
+        import pickle
+
+        return tuple( pickle.dumps(_describe(g), pickle.HIGHEST_PROTOCOL) for g in gs[1:] )
 
-    Else = _compile_if(Else)
+@functools.lru_cache(maxsize=256)
+def _load_described(payload):
+    "Rebuilds a branch in a worker process, only the first time that process receives it"
+    import pickle
 
+    return _build(pickle.loads(payload))
+
+def _call_described(payload, x, state):
+    return _call_with_refs(_load_described(payload), x, state)
+
+def _run_branches(executor, gs, payloads, x, state):
+    """
+Runs the first branch in the current thread and the rest on `executor`, returns the results in order. Nested parallel stages on a thread pool run their branches inline, otherwise the outer branches could take every worker while waiting for inner branches that never get one.
+    """
+    executor = executor if executor is not None else _default_executor()
+
+    if payloads is not None:
+        submitted = [ executor.submit(_call_described, payload, x, state) for payload in payloads ]
+    elif getattr(_POOL_WORKER, "active", False):
+        return [ g(x, state) for g in gs ]
+    else:
+        submitted = [ executor.submit(contextvars.copy_context().run, _call_on_worker, g, x, state) for g in gs[1:] ]
+
+    results = [ gs[0](x, state) ] if gs else []
+    results += [ future.result() for future in submitted ]
+
+    return results
+
+def _parallel_list_stage(executor, *gs):
+    payloads = _branch_payloads(executor, gs)
+
+    def h(x, state):
+        results = _run_branches(executor, gs, payloads, x, state)
+        ys = [ y for y, _ in results ]
+
+        return ys, _merge_branch_states(state, [ branch_state for _, branch_state in results ])
+
+    h._label = "ParallelList"
+    h._head = ("ParallelList", executor)
+    h._children = gs
+    h._rebuild = functools.partial(_parallel_list_stage, executor)
+    h._arebuild = _alist_stage
+
+    return h
+
+def _parallel_dict_stage(executor, keys, *gs):
+    payloads = _branch_payloads(executor, gs)
+
+    def h(x, state):
+        results = _run_branches(executor, gs, payloads, x, state)
+        ys = _RecordObject(zip(keys, [ y for y, _ in results ]))
+
+        return ys, _merge_branch_states(state, [ branch_state for _, branch_state in results ])
+
+    h._label = "ParallelDict"
+    h._head = ("ParallelDict", executor, keys)
+    h._children = gs
+    h._rebuild = functools.partial(_parallel_dict_stage, executor, keys)
+    h._arebuild = functools.partial(_adict_stage, keys)
+
+    return h
+
+def _with_stage(context_f, body_f):
     def g(x, state):
-        y_cond, state = cond(x, state)
+        context, state = context_f(x, state)
+        with context as scope:
+            with _WithContextManager(scope):
+                return body_f(x, state)
 
-        return then(x, state) if y_cond else Else(x, state)
+    g._label = "With"
+    g._head = ("With",)
+    g._children = (context_f, body_f)
+    g._rebuild = _with_stage
+    g._arebuild = _awith_stage
 
     return g
 
+def _if_stage(*children):
+    branches = tuple(zip(children[0:-1:2], children[1:-1:2]))
+    Else = children[-1]
+
+    if len(branches) == 1 and all(map(_is_pure, children)):
+        cond_p, then_p, else_p = [ f._pure for f in children ]
+        g = utils.lift(lambda x: then_p(x) if cond_p(x) else else_p(x))
+
+    elif all(map(_is_pure, children)):
+        pure_branches = tuple( (cond._pure, then._pure) for cond, then in branches )
+        else_p = Else._pure
+
+        @utils.lift
+        def g(x):
+            for cond_p, then_p in pure_branches:
+                if cond_p(x):
+                    return then_p(x)
+
+            return else_p(x)
+
+    else:
+        def g(x, state):
+            for cond, then in branches:
+                y_cond, state = cond(x, state)
+
+                if y_cond:
+                    return then(x, state)
+
+            return Else(x, state)
+
+    g._label = "If"
+    g._head = ("If",)
+    g._children = children
+    g._rebuild = _if_stage
+    g._arebuild = _aif_stage
+
+    return g
+
+def _compile(f, cse=False):
+    stages = []
+
+    for stage in _stages_of(f):
+        if stage is utils.state_identity:
+            continue
+
+        if hasattr(stage, "_rebuild"):
+            shared = _compile_cse(stage) if cse and _cse_root(stage) is not None else None
+            stage = shared if shared is not None else stage._rebuild(*[ _compile(child, cse) for child in stage._children ])
+
+        stages.append(stage)
+
+    return _compile_stages(stages)
+
+_CSE_HEADS = ("fmap", "fmap_flip", "List", "Dict")
+
+def _cse_root(f):
+    "Returns the stage of `f` if it is a pure operator, `List` or `Dict` whose children all receive the same input as it does"
+    stages = [ stage for stage in _stages_of(f) if stage is not utils.state_identity ]
+
+    if len(stages) == 1 and _is_pure(stages[0]) and getattr(stages[0], "_head", ("",))[0] in _CSE_HEADS:
+        return stages[0]
+
+def _compile_cse(stage):
+    """
+Common subexpression elimination. All the sub-expressions reachable from `stage` through pure operators, `List`s and `Dict`s receive the same input, so the ones that are identical (same symbolic node) are computed only once. Returns `None` if there is nothing to share.
+    """
+    counts = collections.Counter()
+
+    def count(f):
+        key = _node_key(_node_of(f))
+
+        if key is not None:
+            counts[key] += 1
+
+            if counts[key] > 1:
+                return
+
+        root = _cse_root(f)
+
+        if root is not None:
+            for child in root._children:
+                count(child)
+
+    count(stage)
+
+    if not counts or max(counts.values()) < 2:
+        return None
+
+    namespace = dict(_RecordObject=_RecordObject)
+    lines = []
+    bound = {}
+    ids = itertools.count()
+
+    def emit(f):
+        if all(stage is utils.state_identity for stage in _stages_of(f)):
+            return "x"
+
+        key = _node_key(_node_of(f))
+
+        if key in bound:
+            return bound[key]
+
+        root = _cse_root(f)
+        head = root._head if root is not None else None
+        name = "_c{0}".format(next(ids))
+
+        if head is None:
+            namespace[name] = _compile(f, True)._pure
+            expr = "{0}(x)".format(name)
+
+        elif head[0] == "fmap":
+            a, b = map(emit, root._children)
+            namespace[name] = head[1]
+            expr = "{0}({1}, {2})".format(name, a, b)
+
+        elif head[0] == "fmap_flip":
+            b = emit(root._children[1])
+            a = emit(root._children[0])
+            namespace[name] = head[1]
+            expr = "{0}({1}, {2})".format(name, b, a)
+
+        elif head[0] == "List":
+            expr = "[{0}]".format(", ".join(map(emit, root._children)))
+
+        else:
+            namespace[name] = head[1]
+            expr = "_RecordObject(zip({0}, ({1},)))".format(name, ", ".join(map(emit, root._children)))
+
+        var = "_t{0}".format(len(lines))
+        lines.append("    {0} = {1}".format(var, expr))
+
+        if key is not None and counts[key] > 1:
+            bound[key] = var
+
+        return var
+
+    result = emit(stage)
+    source = "def _shared(x):\n{0}\n    return {1}\n".format("\n".join(lines), result)
+    exec(compile(source, "<phi.dsl.Compile>", "exec"), namespace)
+
+    h = utils.lift(namespace["_shared"])
+
+    for attr in ("_label", "_head", "_children", "_rebuild", "_arebuild"):
+        setattr(h, attr, getattr(stage, attr))
+
+    return h
+
+def _compile_stages(stages):
+    if len(stages) == 0:
+        return utils.state_identity
+    elif len(stages) == 1:
+        return stages[0]
+
+    pure = all(map(_is_pure, stages))
+    namespace = {}
+    lines = []
+
+    for i, stage in enumerate(stages):
+        name = "_s{0}".format(i)
+
+        if _is_pure(stage):
+            namespace[name] = stage._pure
+            lines.append("    x = {0}(x)".format(name))
+        else:
+            namespace[name] = stage
+            lines.append("    x, state = {0}(x, state)".format(name))
+
+    if pure:
+        source = "def _compiled(x):\n{0}\n    return x\n"
+    else:
+        source = "def _compiled(x, state):\n{0}\n    return x, state\n"
+
+    source = source.format("\n".join(lines))
+    exec(compile(source, "<phi.dsl.Compile>", "exec"), namespace)
+
+    f = utils.lift(namespace["_compiled"]) if pure else namespace["_compiled"]
+    f._stages = tuple(stages)
+
+    return f
+
 #######################
 ### FUNCTIONS
 #######################
@@ -1492,3 +2701,344 @@ def _parse(code):
         return E.Dict(**code)
     else:
         return E.Val(code)
+
+_BINARY_OPERATORS = {
+    operator.add: "+", operator.sub: "-", operator.mul: "*", operator.truediv: "/", operator.floordiv: "//",
+    operator.mod: "%", operator.pow: "**", operator.and_: "&", operator.or_: "|", operator.xor: "^",
+    operator.lt: "<", operator.le: "<=", operator.gt: ">", operator.ge: ">=", operator.eq: "==", operator.ne: "!=",
+}
+_UNARY_OPERATORS = { operator.neg: "-", operator.pos: "+", operator.invert: "~" }
+_INLINE_CONSTANT_TYPES = (int, str, bool, type(None))
+_BUILTIN_METHOD_TYPES = (types.MethodDescriptorType, types.WrapperDescriptorType)
+
+def _operator_symbol(symbols, f):
+    return symbols.get(f) if isinstance(f, types.BuiltinFunctionType) else None
+
+def _trace(f, x, state):
+    "Runs `x` through the stages of `f` and generates a stage function specialised for the path it took, see `phi.dsl.Expression.Trace`"
+    stages = [ stage for stage in _stages_of(f) if stage is not utils.state_identity ]
+
+    if not stages:
+        return f
+
+    pure = all(map(_is_pure, stages))
+    state = utils.StateMap(state)
+    namespace = dict(_RecordObject = _RecordObject)
+    lines = []
+    ids = itertools.count()
+
+    def bind(value, prefix="_c"):
+        name = "{0}{1}".format(prefix, next(ids))
+        namespace[name] = value
+        return name
+
+    def constant(value):
+        return repr(value) if type(value) in _INLINE_CONSTANT_TYPES else bind(value)
+
+    def line(code):
+        lines.append("    " * (depth + 1) + code)
+
+    def assign(expr, value):
+        var = "_t{0}".format(next(ids))
+        line("{0} = {1}".format(var, expr))
+        return var, value
+
+    def guarded(condition, specialised, fallback):
+        """
+Emits `if condition:` with the code generated by `specialised()` and an `else:` that assigns the expression `fallback`, the result of the generic code starting at the guarded sub-expression from the values computed so far
+        """
+        nonlocal depth
+        out = "_t{0}".format(next(ids))
+
+        line("if {0}:".format(condition))
+        depth += 1
+        y, value = specialised()
+        line("{0} = {1}".format(out, y))
+        depth -= 1
+        line("else:")
+        depth += 1
+        line("{0} = {1}".format(out, fallback))
+        depth -= 1
+
+        return out, value
+
+    def generic(f, var):
+        return "{0}({1})".format(bind(f._pure, "_g"), var)
+
+    def emit(f, var, value):
+        for stage in _stages_of(f):
+            if stage is not utils.state_identity:
+                var, value = emit_stage(stage, var, value)
+
+        return var, value
+
+    def emit_all(fs, var, value):
+        return [ emit(f, var, value) for f in fs ]
+
+    def emit_stage(stage, var, value):
+        head = stage._head if hasattr(stage, "_rebuild") else (None,)
+        node = getattr(stage, "_node", (None,))
+        children = getattr(stage, "_children", ())
+
+        if head[0] in ("fmap", "fmap_flip") and _operator_symbol(_BINARY_OPERATORS, head[1]):
+            (a, a_value), (b, b_value) = emit_all(children, var, value)
+
+            if head[0] == "fmap_flip":
+                (a, a_value), (b, b_value) = (b, b_value), (a, a_value)
+
+            return assign("{0} {1} {2}".format(a, _BINARY_OPERATORS[head[1]], b), head[1](a_value, b_value))
+
+        elif head[0] == "List":
+            items = emit_all(children, var, value)
+            return assign("[{0}]".format(", ".join(y for y, _ in items)), [ y for _, y in items ])
+
+        elif head[0] == "Dict":
+            items = emit_all(children, var, value)
+            keys = head[1]
+            return assign("_RecordObject(zip({0}, [{1}]))".format(bind(keys), ", ".join(y for y, _ in items)), _RecordObject(zip(keys, [ y for _, y in items ])))
+
+        elif head[0] == "If":
+            return emit_if(children, var, value)
+
+        elif head[0] in ("And", "Or"):
+            return emit_short_circuit(head[0] == "Or", children, var, value)
+
+        elif node[0] == "ThenAt":
+            _, n, fn, args, kwargs_items, _ = node
+            args = [ constant(arg) for arg in args ]
+            position = min(n - 1, len(args))
+            call = args[:position] + [var] + args[position:] if n > 0 else args
+
+            if kwargs_items:
+                call.append("**" + bind(dict(kwargs_items)))
+
+            return assign("{0}({1})".format(bind(fn, "_f"), ", ".join(call)), stage._pure(value))
+
+        elif node[0] == "Val":
+            return constant(node[1]), node[1]
+
+        elif node[0] == "GetItem":
+            return assign("{0}[{1}]".format(var, constant(node[1])), stage._pure(value))
+
+        elif node[0] == "Rec" and node[1].isidentifier():
+            return assign("{0}.{1}".format(var, node[1]), stage._pure(value))
+
+        elif node[0] == "Obj" and node[1].isidentifier():
+            _, name, args, kwargs_items = node
+            call = [ constant(arg) for arg in args ]
+
+            if kwargs_items:
+                call.append("**" + bind(dict(kwargs_items)))
+
+            t = type(value)
+            method = getattr(t, name, None)
+
+            if t.__module__ == "builtins" and isinstance(method, _BUILTIN_METHOD_TYPES):
+                return guarded(
+                    "type({0}) is {1}".format(var, bind(t, "_T")),
+                    lambda: assign("{0}({1})".format(bind(method, "_m"), ", ".join([var] + call)), stage._pure(value)),
+                    "{0}.{1}({2})".format(var, name, ", ".join(call))
+                )
+
+            return assign("{0}.{1}({2})".format(var, name, ", ".join(call)), stage._pure(value))
+
+        elif _operator_symbol(_UNARY_OPERATORS, stage._pure) and not hasattr(stage, "_node"):
+            return assign("{0}{1}".format(_UNARY_OPERATORS[stage._pure], var), stage._pure(value))
+
+        else:
+            return assign("{0}({1})".format(bind(stage._pure, "_f"), var), stage._pure(value))
+
+    def emit_if(children, var, value):
+        "`children` are `cond, then, ..., Else`, the branch that wasn't taken falls back to the generic `then` or rest of the chain"
+        if len(children) == 1:
+            return emit(children[0], var, value)
+
+        cond, then, rest = children[0], children[1], children[2:]
+        rest = _if_stage(*rest) if len(rest) > 1 else rest[0]
+        c, c_value = emit(cond, var, value)
+
+        if c_value:
+            return guarded(c, lambda: emit(then, var, value), generic(rest, var))
+        else:
+            return guarded("not " + c, lambda: emit_if(children[2:], var, value), generic(then, var))
+
+    def emit_short_circuit(stop, children, var, value):
+        y, y_value = emit(children[0], var, value)
+
+        if len(children) == 1:
+            return y, y_value
+
+        rest = _short_circuit_stage(stop, *children[1:])
+
+        if bool(y_value) is stop:
+            # stopped here, otherwise the generic rest of the chain
+            return guarded(("" if stop else "not ") + y, lambda: (y, y_value), generic(rest, var))
+        else:
+            # went on, otherwise `y` is the result
+            return guarded(("not " if stop else "") + y, lambda: emit_short_circuit(stop, children[1:], var, value), y)
+
+    depth = 0
+    var = "x"
+
+    with _StateContextManager(state):
+        for stage in stages:
+            if _is_pure(stage):
+                var, x = emit(stage, var, x)
+            else:
+                out = "_t{0}".format(next(ids))
+                line("{0}, state = {1}({2}, state)".format(out, bind(stage, "_s"), var))
+                x, state = stage(x, state)
+                var = out
+
+    if pure:
+        source = "def _traced(x):\n{0}\n    return {1}\n"
+    else:
+        source = "def _traced(x, state):\n{0}\n    return {1}, state\n"
+
+    source = source.format("\n".join(lines), var)
+    exec(compile(source, "<phi.dsl.Trace>", "exec"), namespace)
+
+    h = utils.lift(namespace["_traced"]) if pure else namespace["_traced"]
+    h._stages = tuple(stages)
+    h._source = source
+
+    return h
+
+###############################
+# Async Stages
+###############################
+
+def _afmap_stage(opt, f, g):
+    async def h(x, state):
+        y1, state1 = await f(x, state)
+        y2, state2 = await g(x, state)
+
+        return opt(y1, y2), _merge_branch_states(state, [state1, state2])
+
+    return h
+
+def _afmap_flip_stage(opt, f, g):
+    async def h(x, state):
+        y2, state = await g(x, state)
+        y1, state = await f(x, state)
+
+        return opt(y2, y1), state
+
+    return h
+
+def _alist_stage(*gs):
+    import asyncio
+
+    async def h(x, state):
+        results = await asyncio.gather(*[ g(x, state) for g in gs ])
+        ys = [ y for y, _ in results ]
+
+        return ys, _merge_branch_states(state, [ branch_state for _, branch_state in results ])
+
+    return h
+
+def _adict_stage(keys, *gs):
+    import asyncio
+
+    async def h(x, state):
+        results = await asyncio.gather(*[ g(x, state) for g in gs ])
+        ys = _RecordObject(zip(keys, [ y for y, _ in results ]))
+
+        return ys, _merge_branch_states(state, [ branch_state for _, branch_state in results ])
+
+    return h
+
+def _awith_stage(context_f, body_f):
+    async def g(x, state):
+        context, state = await context_f(x, state)
+
+        if hasattr(context, "__aenter__"):
+            async with context as scope:
+                with _WithContextManager(scope):
+                    return await body_f(x, state)
+        else:
+            with context as scope:
+                with _WithContextManager(scope):
+                    return await body_f(x, state)
+
+    return g
+
+def _aif_stage(*children):
+    branches = tuple(zip(children[0:-1:2], children[1:-1:2]))
+    Else = children[-1]
+
+    async def g(x, state):
+        for cond, then in branches:
+            y_cond, state = await cond(x, state)
+
+            if y_cond:
+                return await then(x, state)
+
+        return await Else(x, state)
+
+    return g
+
+def _ashort_circuit_stage(stop, *gs):
+    async def h(x, state):
+        y = None
+
+        for g in gs:
+            y, state = await g(x, state)
+
+            if bool(y) is stop:
+                break
+
+        return y, state
+
+    return h
+
+def _amemo_stage(cache, key_fn, pure, f):
+    async def h(x, state):
+        key = key_fn(x)
+        found, entry = cache.get(key)
+
+        if found:
+            y, delta = entry
+
+            if delta and not pure:
+                state = state.merge(delta)
+                _REFS.set(state)
+
+            return y, state
+
+        y, new_state = await f(x, state)
+        cache.put(key, (y, _NO_DELTA if pure else _state_delta(state, new_state)))
+
+        return y, new_state
+
+    return h
+
+def _aleaf_stage(f):
+    async def g(x, state):
+        y, state = f(x, state)
+
+        if inspect.isawaitable(y):
+            y = await y
+
+        return y, state
+
+    return g
+
+def _async(f):
+    "Translates a stage function into a coroutine function that awaits the awaitable results of its stages"
+    stages = [ stage for stage in _stages_of(f) if stage is not utils.state_identity ]
+    astages = [
+        stage._arebuild(*[ _async(child) for child in stage._children ]) if hasattr(stage, "_arebuild") else _aleaf_stage(stage)
+        for stage in stages
+    ]
+
+    if len(astages) == 1:
+        return astages[0]
+
+    async def h(x, state):
+        for astage in astages:
+            x, state = await astage(x, state)
+
+        return x, state
+
+    return h
@@ -0,0 +1,161 @@
+"""
+`NumpyBuilder` integrates [numpy](http://www.numpy.org/) into the DSL. All of numpy's element-wise ufuncs (`add`, `multiply`, `sqrt`, `exp`, `greater`, ...) and its most common array functions (`dot`, `transpose`, `sum`, `mean`, ...) are registered as methods, the array being piped down is always passed as the first argument. `phi.numpy_builder.N` is an instance of this class.
+
+    from phi.numpy_builder import N
+    import numpy as np
+
+    x = np.array([[1,2],[3,4]])
+    y = np.array([[5,6],[7,8]])
+
+    z = N.Pipe(
+        x, N
+        .dot(y)
+        .add(x)
+        .transpose()
+        .sum(axis=1)
+    )
+
+Unlike a builder patched one function at a time with `phi.builder.Builder.PatchAt`, consecutive ufuncs are fused into a single stage that allocates one output array and runs the rest of the ufuncs in-place over it using their `out=` argument. This is only done when it is safe: an ufunc whose result has a different type or shape than the buffer (e.g. `divide` over integers, a comparison or a broadcast that grows the array) gets a new buffer instead. The array being piped into a fused run is never modified unless it was just created by a stage of the same expression (e.g. the result of `dot` in the previous example), so the expression
+
+    N.multiply(2.0).add(1.0).sqrt()
+
+allocates one temporary array instead of three.
+
+This module requires `numpy`, its not imported by `phi`.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import inspect
+
+import numpy as np
+
+from .python_builder import PythonBuilder
+from . import dsl
+from . import utils
+
+
+class NumpyBuilder(PythonBuilder):
+    """
+A `phi.python_builder.PythonBuilder` with numpy's ufuncs and array functions registered as methods. Chains of ufuncs are fused as described in `phi.numpy_builder`, e.g.
+
+    from phi.numpy_builder import N
+
+    f = N.dot(w).add(b).tanh()
+
+runs `dot` and then a single fused stage that computes `add` and `tanh` over the result of `dot` without allocating new arrays.
+    """
+
+    def __then__(self, other, **kwargs):
+        ops = getattr(other, "_ufuncs", None)
+
+        if ops is None:
+            return super(NumpyBuilder, self).__then__(other, **kwargs)
+
+        f = self._f
+        last = dsl._stages_of(f)[-1]
+        prefix = getattr(f, "_ufunc_prefix", None)
+
+        if prefix is not None and hasattr(last, "_ufuncs"):
+            # extend the run at the end of `f` instead of appending a new one
+            f, ops, inplace = prefix, last._ufuncs + ops, last._inplace
+        else:
+            inplace = getattr(last, "_fresh", False)
+
+        expr = super(NumpyBuilder, self.__unit__(f)).__then__(_ufuncs_stage(ops, inplace), **kwargs)
+        expr._f._ufunc_prefix = f
+
+        return expr
+
+N = NumpyBuilder()
+
+###############################
+# Stages
+###############################
+
+def _ufuncs_stage(ops, inplace):
+    """
+Fused run of ufuncs, `ops` is a tuple of `(ufunc, args, kwargs_items)`. The first ufunc allocates the output buffer, unless `inplace` is `True` in which case the input is used as the buffer, the rest of the ufuncs write over it.
+    """
+    calls = tuple((ufunc, args, dict(kwargs_items)) for ufunc, args, kwargs_items in ops)
+
+    def g(x):
+        out = x if inplace and isinstance(x, np.ndarray) else None
+
+        for ufunc, args, kwargs in calls:
+            if out is not None and not kwargs:
+                try:
+                    x = ufunc(out, *args, out=out, casting="no")
+                    continue
+                except (TypeError, ValueError):
+                    # different result type or shape, can't reuse the buffer
+                    pass
+
+            x = ufunc(x, *args, **kwargs)
+            out = x if isinstance(x, np.ndarray) and "out" not in kwargs else None
+
+        return x
+
+    g = utils.lift(g)
+    g._ufuncs = ops
+    g._inplace = inplace
+    g._fresh = True
+    g._leaf_stage = _ufuncs_stage
+
+    return dsl._leaf(g, "|".join(ufunc.__name__ for ufunc, _, _ in ops), "Ufuncs", ops, inplace)
+
+def _array_stage(f, name, args, kwargs_items, fresh):
+    g = dsl._then_at_stage(1, f, args, kwargs_items, name)
+
+    if fresh:
+        g._fresh = True
+
+    return g
+
+###############################
+# Registration
+###############################
+
+# functions that always return a new array
+_FRESH_FUNCTIONS = [
+    "dot", "inner", "outer", "tensordot", "kron", "cross",
+    "sum", "prod", "mean", "average", "std", "var", "median",
+    "max", "min", "argmax", "argmin", "cumsum", "cumprod",
+    "clip", "round", "diff", "sort", "argsort", "copy",
+]
+
+# functions that might return a view of their input
+_VIEW_FUNCTIONS = [
+    "transpose", "reshape", "ravel", "squeeze", "swapaxes", "moveaxis",
+    "expand_dims", "atleast_1d", "atleast_2d", "asarray",
+]
+
+def _register_ufunc(name, ufunc):
+    def method(self, *args, **kwargs):
+        return self.__then__(_ufuncs_stage(((ufunc, args, tuple(sorted(kwargs.items()))),), False))
+
+    NumpyBuilder.RegisterMethod(method, "numpy.", alias=name, wrapped=ufunc, explanation="""
+However, the array being piped down is passed as the 1st argument and consecutive ufuncs are fused, see `phi.numpy_builder`.""")
+
+def _register_function(name, f, fresh):
+    def method(self, *args, **kwargs):
+        return self.__then__(_array_stage(f, name, args, tuple(sorted(kwargs.items())), fresh))
+
+    NumpyBuilder.RegisterMethod(method, "numpy.", alias=name, wrapped=f, explanation="""
+However, the array being piped down is passed as the 1st argument.""")
+
+for _name, _ufunc in inspect.getmembers(np, lambda member: isinstance(member, np.ufunc)):
+    # generalized ufuncs like `matmul` are not element-wise
+    if _name[0] != "_" and _ufunc.nout == 1 and _ufunc.signature is None:
+        _register_ufunc(_name, _ufunc)
+
+for _names, _fresh in [(_FRESH_FUNCTIONS, True), (_VIEW_FUNCTIONS, False)]:
+    for _name in _names:
+        # not hasattr: that also sees the builtins of PythonBuilder, like sum or round
+        if hasattr(np, _name) and _name not in NumpyBuilder.__dict__:
+            _register_function(_name, getattr(np, _name), _fresh)
+
+__all__ = ["NumpyBuilder", "N"]
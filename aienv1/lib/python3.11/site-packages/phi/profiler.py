@@ -0,0 +1,154 @@
+"""
+The `phi.profiler.Profiler` records how much time each stage of an expression takes. Use `phi.dsl.Expression.Profile` to get an instrumented version of any expression
+
+    from phi import P, Obj
+
+    f = Obj.split(' ').map(len) >> sum
+    g = f.Profile()
+
+    for line in lines:
+        g(line)
+
+    print(g.Profiler.table())
+
+Every stage is labeled with the name of its function, the name of the registered `Builder` method (e.g. `map`), the `Obj` method (e.g. `Obj.split`) or the combinator (e.g. `List`, `If`, `add` for `+`), and identified by its path inside the expression, e.g. `2.1.0` is the first stage of the second branch of the third stage. The stages of the n-th expression instrumented with the same profiler are prefixed with `n/`.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from . import dsl
+from . import utils
+import threading
+import time
+
+
+class _StageRecord(object):
+
+    def __init__(self, path, label):
+        self.path = path
+        self.label = label
+        self.calls = 0
+        self.time = 0.0
+        self.input_size = 0
+        self.output_size = 0
+
+    def as_dict(self):
+        return dict(
+            label = self.label,
+            calls = self.calls,
+            time = self.time,
+            mean_time = self.time / self.calls if self.calls else 0.0,
+            mean_input_size = self.input_size / self.calls if self.calls else 0.0,
+            mean_output_size = self.output_size / self.calls if self.calls else 0.0,
+        )
+
+
+class Profiler(object):
+    """
+Collects the call count, cumulative wall time and mean input/output sizes (`len` of the value, `1` if it has no length) of every stage of an instrumented expression. The time of a stage with branches (e.g. `List`) includes the time of its branches.
+    """
+
+    def __init__(self):
+        self._records = {}
+        self._roots = 0
+        self._lock = threading.Lock()
+
+    def _root(self):
+        "Path prefix for a new expression, the stages of the n-th expression instrumented with this profiler are prefixed with `n/`"
+        with self._lock:
+            root = "{0}/".format(self._roots) if self._roots else ""
+            self._roots += 1
+
+        return root
+
+    def _record(self, path, label):
+        record = _StageRecord(path, label)
+        self._records[path] = record
+        return record
+
+    def _add(self, record, elapsed, x, y):
+        with self._lock:
+            record.calls += 1
+            record.time += elapsed
+            record.input_size += _size(x)
+            record.output_size += _size(y)
+
+    def stats(self):
+        "Returns a `dict` from the path of each stage to a `dict` with its `label`, `calls`, `time`, `mean_time`, `mean_input_size` and `mean_output_size`."
+        with self._lock:
+            return { path: record.as_dict() for path, record in sorted(self._records.items(), key=_path_key) }
+
+    def by_label(self):
+        "Same as `stats` but the stages with the same label are added together."
+        totals = {}
+
+        for stats in self.stats().values():
+            total = totals.setdefault(stats["label"], dict(calls = 0, time = 0.0))
+            total["calls"] += stats["calls"]
+            total["time"] += stats["time"]
+
+        return totals
+
+    def table(self):
+        "Returns the stats as a text table, one row per stage."
+        rows = [ ("path", "stage", "calls", "time (s)", "mean (s)", "in size", "out size") ]
+        rows += [
+            (path, stats["label"], str(stats["calls"]), "{0:.6f}".format(stats["time"]), "{0:.6f}".format(stats["mean_time"]), "{0:.1f}".format(stats["mean_input_size"]), "{0:.1f}".format(stats["mean_output_size"]))
+            for path, stats in self.stats().items()
+        ]
+        widths = [ max(len(row[i]) for row in rows) for i in range(len(rows[0])) ]
+
+        return "\n".join(
+            "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+            for row in rows
+        )
+
+    def reset(self):
+        with self._lock:
+            for record in self._records.values():
+                record.calls = 0
+                record.time = 0.0
+                record.input_size = 0
+                record.output_size = 0
+
+
+def _size(x):
+    try:
+        return len(x)
+    except TypeError:
+        return 1
+
+def _path_key(item):
+    root, _, path = item[0].rpartition("/")
+    return [ int(root or 0) ] + [ int(i) for i in path.split(".") ]
+
+def _timed(stage, record, profiler):
+    def h(x, state):
+        start = time.perf_counter()
+        y, next_state = stage(x, state)
+        profiler._add(record, time.perf_counter() - start, x, y)
+
+        return y, next_state
+
+    return h
+
+def instrument(f, profiler, path=None):
+    "Returns the stage function `f` with every stage wrapped so its calls are recorded in `profiler`"
+    path = path if path is not None else profiler._root()
+    stages = [ stage for stage in dsl._stages_of(f) if stage is not utils.state_identity ]
+    timed = []
+
+    for i, stage in enumerate(stages):
+        stage_path = path + str(i)
+        record = profiler._record(stage_path, dsl._label_of(stage))
+
+        if hasattr(stage, "_rebuild"):
+            children = [ instrument(child, profiler, stage_path + "." + str(j) + ".") for j, child in enumerate(stage._children) ]
+            stage = stage._rebuild(*children)
+
+        timed.append(_timed(stage, record, profiler))
+
+    return dsl._compile_stages(timed)
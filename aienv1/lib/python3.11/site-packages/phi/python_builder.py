@@ -12,29 +12,51 @@ from .builder import Builder
 from . import utils
 import inspect
 
-class PythonBuilder(Builder):
+class _LazyMethods(type):
+    "Metaclass of `phi.python_builder.PythonBuilder`, registers a built-in function the first time it is looked up on the class"
+
+    def __getattr__(cls, name):
+        lazy = cls._LAZY_METHODS.get(name)
+
+        if lazy is None:
+            raise AttributeError("type object '{0}' has no attribute '{1}'".format(cls.__name__, name))
+
+        n, f = lazy
+        PythonBuilder.RegisterAt(n, f, "", alias=name)
+
+        return getattr(cls, name)
+
+class PythonBuilder(Builder, metaclass=_LazyMethods):
     """
 This class has two types of methods:
 
 1. Methods that start with a lowercase letter are core python functions automatically registered as methods (e.g. `phi.python_builder.PythonBuilder.map` or `phi.python_builder.PythonBuilder.sum`).
 2. Methods that start with a capytal letter like `phi.python_builder.PythonBuilder.And`, `phi.python_builder.PythonBuilder.Not`, `phi.python_builder.PythonBuilder.Contains`, this is done because some mimimic keywords (`and`, `or`, `not`, etc) and its ilegal to give them these lowercase names, however, methods like `phi.python_builder.PythonBuilder.Contains` that could use lowercase are left capitalized to maintain uniformity.
+
+The methods for the built-in functions are registered lazily, the first time they are accessed on the class or an instance, to keep `import phi` fast.
     """
 
+    _LAZY_METHODS = {}
+
+    def __getattr__(self, name):
+        if name not in PythonBuilder._LAZY_METHODS:
+            raise AttributeError("'{0}' object has no attribute '{1}'".format(type(self).__name__, name))
+
+        getattr(PythonBuilder, name)
+
+        return getattr(self, name)
+
+    def __dir__(self):
+        return sorted(set(super(PythonBuilder, self).__dir__()) | set(PythonBuilder._LAZY_METHODS))
+
 P = PythonBuilder()
 
 # built in functions
 _function_2_names = ["map", "filter", "reduce"]
-_functions_2 = [ (_name, f) for _name, f in __builtins__.items() if _name in _function_2_names ]
 
 for _name, f in __builtins__.items():
-    try:
-        if hasattr(f, "__name__") and _name[0] is not "_" and not _name[0].isupper() and _name not in _function_2_names:
-            PythonBuilder.Register(f, "", alias=_name)
-    except Exception as e:
-        print(e)
-
-for _name, f in _functions_2:
-    PythonBuilder.Register2(f, "")
+    if hasattr(f, "__name__") and _name[0] != "_" and not _name[0].isupper():
+        PythonBuilder._LAZY_METHODS[_name] = (2 if _name in _function_2_names else 1, f)
 
 #custom methods
 @PythonBuilder.Register("phi.python_builder.", explain=False)
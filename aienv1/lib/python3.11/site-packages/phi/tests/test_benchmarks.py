@@ -0,0 +1,47 @@
+from phi import benchmarks
+import subprocess
+import sys
+
+
+class TestBenchmarks(object):
+
+    def test_run(self):
+        results = benchmarks.run("^(seq_depth_10|then_at|python_builder_chain|write_read_10)$", repeat = 1, number = 2)
+        stats = results["benchmarks"]
+
+        assert list(stats) == ["seq_depth_10", "write_read_10", "then_at", "python_builder_chain"]
+        assert all(s["best"] > 0 and s["number"] == 2 for s in stats.values())
+
+    def test_every_benchmark_runs(self):
+        for name in benchmarks.names():
+            setup, _ = benchmarks._BENCHMARKS[name]
+
+            if name != "import_phi":
+                setup()()
+
+    def test_save_compare(self, tmpdir):
+        path = str(tmpdir.join("results.json"))
+        old = dict(benchmarks = dict(a = dict(best = 1.0), b = dict(best = 1.0)))
+        benchmarks.save(old, path)
+
+        new = dict(benchmarks = dict(a = dict(best = 1.05), b = dict(best = 2.0), c = dict(best = 1.0)))
+        rows = benchmarks.compare(benchmarks.load(path), new, threshold = 0.1)
+
+        assert [ (name, regressed) for name, _, _, _, regressed in rows ] == [("a", False), ("b", True)]
+
+    def test_import_phi(self):
+        # modules that made `import phi` twice as slow and the lazily registered builtins
+        code = "; ".join([
+            "import sys, phi",
+            "from phi.python_builder import PythonBuilder",
+            "print([ m for m in ('asyncio', 'concurrent.futures', 'pickle', 'json') if m in sys.modules ])",
+            "print([ name for name in PythonBuilder._LAZY_METHODS if name in PythonBuilder.__dict__ ])",
+        ])
+        loaded, registered = subprocess.check_output([sys.executable, "-c", code]).decode().split("\n")[:2]
+
+        assert loaded == "[]"
+        assert registered == "[]"
+
+        results = benchmarks.run("^import_phi$", repeat = 3)
+
+        assert results["benchmarks"]["import_phi"]["best"] < 1.0
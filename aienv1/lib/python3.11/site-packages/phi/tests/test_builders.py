@@ -67,6 +67,63 @@ class TestBuilder(object):
 
         assert f(2.0) == 4
 
+    def test_patch_at_cache(self, tmp_path):
+        from phi.builder import Builder, RegistrationCache
+        from . import some_module
+        import json
+
+        path = str(tmp_path / "cache.json")
+        some_module.__version__ = "1.0"
+
+        def patched(**kwargs):
+            class Patched(Builder): pass
+            Patched.PatchAt(1, some_module, **kwargs)
+            return Patched
+
+        try:
+            A = patched(cache=RegistrationCache(path))
+
+            with open(path) as f:
+                entry = json.load(f)[some_module.__name__ + "==1.0"]
+
+            assert entry["members"]["isfunction"] == ["other_fun", "some_fun"]
+            assert A.some_fun.__doc__ in entry["docs"].values()
+
+            B = patched(cache=RegistrationCache(path))
+            C = patched(explain=False)
+
+            assert B.some_fun.__doc__ == A.some_fun.__doc__
+            assert C.some_fun.__doc__ == some_module.some_fun.__doc__
+            assert B().some_fun()(None) == C().some_fun()(None) == "YES"
+
+            D = patched(cache=RegistrationCache(path), module_alias="sm.")
+
+            assert "sm.some_fun" in D.some_fun.__doc__
+            assert "sm.some_fun" not in A.some_fun.__doc__
+            assert D.some_fun.__doc__ != A.some_fun.__doc__
+        finally:
+            del some_module.__version__
+
+    def test_lazy_builtins(self):
+        from phi.python_builder import PythonBuilder
+
+        assert "sorted" in dir(P)
+        assert P.sorted(reverse=True)([2, 3, 1]) == [3, 2, 1]
+        assert "sorted" in PythonBuilder.__dict__
+
+        assert P.map(P + 1).list()([1, 2]) == [2, 3]
+
+        with pytest.raises(AttributeError):
+            P.not_a_builtin
+
+        assert "zip" not in PythonBuilder.__dict__
+        assert callable(PythonBuilder.zip)
+        assert "zip" in PythonBuilder.__dict__
+        assert P.zip([3, 4]).list()([1, 2]) == [(1, 3), (2, 4)]
+
+        with pytest.raises(AttributeError):
+            PythonBuilder.not_a_builtin
+
     def test_methods(self):
         x = P.Pipe(
             "hello world",
@@ -466,3 +523,25 @@ class TestBuilder(object):
             P * 100,
             Read.s - 1
         )
+
+    def test_flatten(self):
+        from phi import utils
+
+        assert P.Pipe([1, [2, (3, "ab")], [], [[b"cd"]]], P.Flatten()) == [1, 2, 3, "ab", b"cd"]
+        assert utils.flatten("abc") == ["abc"]
+        assert utils.flatten_list([1, [2, (3, [4])], [[5]]]) == [1, 2, (3, [4]), 5]
+        assert utils.flatten_list(iter([1, [2, 3], 4])) == [1, 2, 3, 4]
+        assert utils.flatten_list(i for i in [1, 2]) == [1, 2]
+        assert utils.flatten_list((1, 2)) == [1, 2]
+
+        deep = [0]
+        for i in range(1, 10000):
+            deep = [deep, i]
+
+        assert utils.flatten(deep) == list(range(10000))
+        assert utils.flatten_list(deep) == list(range(10000))
+
+        np = pytest.importorskip("numpy")
+
+        assert utils.flatten([np.arange(4).reshape(2, 2), [np.array([4.5])]]) == [0, 1, 2, 3, 4.5]
+        assert utils.flatten(np.ones((2, 2))) == [1.0] * 4
@@ -1,5 +1,10 @@
 from phi.api import *
 from phi import dsl
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
+import operator
+import pickle
+import time
 import pytest
 
 class TestDSL(object):
@@ -261,6 +266,37 @@ class TestDSL(object):
         assert f(5) == 5
         assert f(-3) == 0
 
+    def test_elif_chain(self):
+        f = If(P > 10, "big").Elif(P > 5, "medium").Elif(P > 0, "small").Else("zero")
+
+        assert [ f(x) for x in [11, 6, 1, 0] ] == ["big", "medium", "small", "zero"]
+        assert len(f._f._children) == 7
+        assert f.Compile()(6) == "medium"
+
+        g = If(P > 10, Write(s = "big")).Elif(P > 5, Write(s = "medium")).Else(Write(s = "small")) >> Read.s
+
+        assert g(6) == "medium"
+        assert g(1) == "small"
+        assert asyncio.run(g.ACall(11)) == "big"
+
+    def test_and_or(self):
+        calls = []
+        expensive = P.Then(lambda x: calls.append(x) or x * 2)
+
+        assert And(P > 0, expensive)(0) == False
+        assert Or(P > 0, expensive)(1) == True
+        assert calls == []
+
+        assert And(P > 0, expensive)(3) == 6
+        assert Or(P > 0, expensive)(-1) == -2
+        assert calls == [3, -1]
+
+        f = Or(Write(a = P > 0), Read.a, P * 10)
+
+        assert f(1) == True
+        assert f(-1) == -10
+        assert asyncio.run(And(P > 0, expensive).ACall(0)) == False
+
     def test_right_hand(self):
 
         f = Seq(
@@ -299,3 +335,402 @@ class TestDSL(object):
             P + 2,   # 20 + 2 == 22
             ReadList('a', 'b', P)  # [a, b, 22] == [2, 4, 22]
         )
+
+    def test_compile_long_sequence(self):
+
+        f = Seq(*[ P + 1 for i in range(5000) ])
+        g = f.Compile()
+
+        assert g(0) == 5000
+        assert len(g._f._stages) == 5000
+
+    def test_compile_branches(self):
+
+        f = Seq(
+            P + 1,
+            Write(a = P),
+            List(
+                P * 2
+            ,
+                Seq(P + 1, P + 1)
+            ,
+                Read.a
+            ),
+            Dict(
+                first = P[0],
+                last = P[-1]
+            ),
+            If(Rec.first > 10,
+                "big"
+            ).Else(
+                Rec.last
+            )
+        )
+        g = f.Compile()
+
+        assert f(1) == g(1) == 2
+        assert f(10) == g(10) == "big"
+        assert f(1, True) == g(1, True)
+
+    def test_pure_expressions(self):
+
+        f = Seq(P + 1, List(P * 2, Dict(x = P)), P[0])
+        assert dsl._is_pure(f._f)
+        assert f(1) == 4
+        assert f(1, True, a = 1) == (4, {"a": 1})
+
+        g = Seq(P + 1, Write(a = P), Read.a + P)
+        assert not dsl._is_pure(g._f)
+        assert g(1, True) == (4, {"a": 2})
+        assert g.Compile()(1, True) == (4, {"a": 2})
+
+    def test_concurrent_refs(self):
+
+        def slow_read(x):
+            time.sleep(0.01)
+            return Ref.a
+
+        f = Seq(Write(a = P), P + 1, slow_read)
+
+        with ThreadPoolExecutor(8) as pool:
+            assert list(pool.map(f, range(32))) == list(range(32))
+
+    def test_concurrent_context(self):
+
+        class Scope(object):
+            def __init__(self, value):
+                self.value = value
+            def __enter__(self):
+                return self.value
+            def __exit__(self, *args):
+                pass
+
+        def slow_context(x):
+            time.sleep(0.01)
+            return Context()
+
+        f = With(Scope, slow_context, P + 1)
+
+        with ThreadPoolExecutor(8) as pool:
+            assert list(pool.map(f, range(32))) == list(range(1, 33))
+
+    def test_async(self):
+
+        async def add1(x):
+            await asyncio.sleep(0.01)
+            return x + 1
+
+        f = Seq(
+            add1,
+            P * 2,
+            Write(a = add1),
+            List(add1, Seq(add1, add1), Read.a),
+            Dict(first = P[0], last = P[-1])
+        )
+
+        y = asyncio.run(f.ACall(1))
+
+        assert y.first == 6
+        assert y.last == 5
+
+        assert 4 == asyncio.run(APipe(1, add1, P * 2))
+
+    def test_async_branches_run_concurrently(self):
+
+        async def slow(x):
+            await asyncio.sleep(0.1)
+            return x
+
+        f = List(*[ Seq(P + i, slow) for i in range(10) ])
+
+        start = time.time()
+        ys, state = asyncio.run(f.ACall(0, True, a = 1))
+
+        assert ys == list(range(10))
+        assert state == {"a": 1}
+        assert time.time() - start < 0.5
+
+    def test_parallel_branches(self):
+
+        def slow(x):
+            time.sleep(0.1)
+            return x
+
+        with ThreadPoolExecutor(10) as pool:
+            f = Seq(
+                Write(a = P),
+                ParallelList(*([ Seq(P + i, slow) for i in range(9) ] + [ Read.a + 100 ]), executor = pool)
+            )
+
+            start = time.time()
+            assert f(0) == list(range(9)) + [100]
+            assert time.time() - start < 0.5
+
+        f = Seq(
+            ParallelDict(
+                x = P + 1,
+                y = Write(b = P * 2)
+            ),
+            Rec.x + Rec.y
+        )
+
+        assert f(1, True, a = 0) == (4, {"a": 0, "b": 2})
+
+    def test_nested_parallel_branches(self):
+
+        def slow(x):
+            time.sleep(0.001)
+            return x
+
+        with ThreadPoolExecutor(4) as pool:
+            inner = ParallelList(*[ Seq(P + i, slow) for i in range(8) ], executor = pool)
+            f = ParallelList(*([ inner ] * 40), executor = pool)
+
+            assert f(0) == [ list(range(8)) ] * 40
+
+        f = ParallelList(*([ ParallelList(*[ Seq(P + i, slow) for i in range(8) ]) ] * 40))
+
+        assert f(0) == [ list(range(8)) ] * 40
+
+    def test_trace(self):
+        f = Seq(
+            P * 2,
+            List(-P, P + 1, Dict(a = P % 3)),
+            If(P[0] < -10, "neg").Elif(P[1] > 5, Val("big")).Else(P[2] >> Rec.a)
+        )
+        g = f.Trace(4)
+
+        assert "else:" in g._f._source # guards
+        assert [ g(x) for x in [4, 6, 1, 2] ] == [ f(x) for x in [4, 6, 1, 2] ] == ["big", "neg", 2, 1]
+
+        f = Obj.split(" ").map(len) >> sum >> And(P > 3, Or(P > 10, "short"))
+        g = f.Trace("hello world")
+
+        class Text(str):
+            def split(self, sep):
+                return ["overridden"] * 4
+
+        xs = ["hello world", "hello", "hi", Text("a")]
+
+        assert [ g(x) for x in xs ] == [ f(x) for x in xs ] == ["short", "short", False, True]
+
+        calls = []
+
+        def double(x):
+            calls.append(x)
+            return x * 2
+
+        f = List(P.Then(double), If(P > 10, "big").Else(Obj.bit_length()))
+        g = f.Trace(20)
+
+        assert g(5) == f(5) == [10, 3]
+        assert calls == [20, 5, 5] # the fallback doesn't run double again
+
+        f = Seq(Write(a = P + 1), P.Then(pow, 2), Read.a + P)
+        g = f.Trace(2)
+
+        assert g(2) == f(2) == 12
+        assert g(3, True) == f(3, True) == (20, {"a": 4})
+
+    def test_pickle(self):
+        f = Seq(
+            Obj.split(" "), P.map(len), list,
+            Write(a = P),
+            List(P[0] + 1, Read.a, Dict(total = sum)),
+            If(P[0] > 2, "big").Elif(P[0] > 1, "medium").Else("small")
+        )
+        g = pickle.loads(pickle.dumps(f))
+
+        assert type(g) is type(f)
+        assert g("ab c") == f("ab c") == "big"
+        assert g("a") == f("a") == "medium"
+
+        m = pickle.loads(pickle.dumps(P.Memo(P + 1)))
+
+        assert m(1) == 2
+
+        with pytest.raises(Exception):
+            pickle.dumps(P.Then(lambda x: x))
+
+    def test_process_pool(self):
+
+        with ProcessPoolExecutor(2) as pool:
+            assert list(pool.map(P.Then(pow, 2) + 1, range(4))) == [1, 2, 5, 10]
+
+            f = Seq(Write(a = P), ParallelList(P * 2, P.Then(pow, 3), Read.a, executor = pool))
+
+            assert f(3) == [6, 27, 3]
+
+            # the branches are described once, when the stage is built
+            describe, dsl._describe = dsl._describe, None
+
+            try:
+                assert f(2) == [4, 8, 2]
+            finally:
+                dsl._describe = describe
+
+    def test_stream(self):
+
+        def naturals():
+            n = 0
+            while True:
+                yield n
+                n += 1
+
+        f = Seq(
+            Stream.map(P * 2),
+            Stream.filter(P % 3 == 0),
+            Stream.window(2),
+            Stream.map(sum),
+            Stream.batch(2),
+            Stream.take(3),
+            list
+        )
+
+        assert f(naturals()) == [[6, 18], [30, 42], [54, 66]]
+
+        assert 5 == P.Pipe(
+            range(5),
+            Stream.map(P + Read.a),
+            Stream.reduce(max),
+            refs = dict(a = 1)
+        )
+
+        assert Pipe(range(5), Stream.window(2, step=2), list) == [(0, 1), (2, 3)]
+
+        for n, step in [(2, 0), (0, 1), (-1, 1), (2, -3)]:
+            with pytest.raises(ValueError):
+                Stream.window(n, step=step)
+
+        with pytest.raises(ValueError):
+            Stream.batch(0)
+
+    def test_memo(self):
+
+        calls = []
+
+        def search(query):
+            calls.append(query)
+            return len(query)
+
+        f = P.Memo(search, maxsize=2)
+
+        assert f("a") == 1
+        assert f("a") == 1
+        assert f("bb") == 2
+        assert f("ccc") == 3
+        assert f("a") == 1  # evicted
+
+        assert calls == ["a", "bb", "ccc", "a"]
+        assert f.Cache.info() == dsl.MemoCacheInfo(hits=1, misses=4, maxsize=2, currsize=2)
+
+        g = P.Memo(Seq(sum, Write(total = P)), key=tuple)
+        h = g >> Read.total
+
+        assert h([1, 2]) == 3
+        assert h([1, 2], True) == (3, {"total": 3})
+        assert g.Cache.info().hits == 1
+        assert not hasattr(h, "Cache")
+
+    def test_memo_shared_cache(self):
+        cache = dsl.MemoCache()
+        stateful = P.Memo(Seq(P + 1, Write(z = P)), cache=cache)
+        pure = P.Memo(P + 1, cache=cache)
+
+        assert stateful(1, True) == (2, {"z": 2})
+        assert pure(1) == 2
+        assert pure(5) == 6
+        assert stateful(5, True) == (6, {})
+        assert asyncio.run(pure.ACall(1)) == 2
+        assert asyncio.run(stateful.ACall(1, True)) == (2, {"z": 2})
+        assert cache.info().hits == 4
+
+    def test_memo_ttl(self):
+
+        f = P.Memo(P + 1, ttl=0.05)
+
+        assert f(1) == 2
+        assert f(1) == 2
+        time.sleep(0.1)
+        assert f(1) == 2
+
+        assert f.Cache.info().hits == 1
+        assert f.Cache.info().misses == 2
+
+    def test_graph(self):
+
+        assert (P + 1).Graph() == ("fmap", operator.add, ("Seq",), ("Val", 1))
+        assert (P[0] + Obj.count(1)).Graph() == (P[0] + Obj.count(1)).Graph()
+        assert Seq(len, P * 2).Graph() == ("Seq", ("Function", len), ("fmap", operator.mul, ("Seq",), ("Val", 2)))
+
+    def test_compile_keeps_side_effects(self):
+        f = List(Obj.pop(), Obj.pop())
+
+        assert f([1, 2, 3]) == f.Compile()([1, 2, 3]) == [3, 2]
+
+        counter = iter(range(10))
+        nxt = lambda x: next(counter)
+        g = List(P.Then(nxt), P.Then(nxt))
+
+        assert g(None) == [0, 1]
+        assert g.Compile()(None) == [2, 3]
+
+    def test_common_subexpressions(self):
+
+        calls = []
+
+        def f(x):
+            calls.append(x)
+            return x * 10
+
+        e = (P.Then(f) + 1) * P.Then(f)
+
+        assert e(2) == 420
+        assert calls == [2, 2]
+
+        del calls[:]
+        assert e.Compile(cse=True)(2) == 420
+        assert calls == [2]
+
+        del calls[:]
+        assert e.Compile()(2) == 420
+        assert calls == [2, 2]
+
+        g = List(P[0] + P[-1], P[0] * 2, Dict(a = P[0], b = 2 - P[0]))
+
+        assert g([1, 2, 3]) == g.Compile(cse=True)([1, 2, 3])
+
+        h = List(P[-1] * 1.0, P[-1] * 1).Compile(cse=True)
+
+        assert list(map(type, h([1, 2, 3]))) == [float, int]
+
+    def test_vectorize(self):
+        np = pytest.importorskip("numpy")
+
+        f = (P * 6) / (P + 2)
+        x = np.arange(10.0)
+
+        assert np.allclose(f.Vectorize()(x), [ f(xi) for xi in x ])
+
+        g = (P[0] + P[-1]) * 2 > -P[1]
+        rows = np.array([[1, -20, 3], [4, 50, 6], [-7, 8, -9]])
+
+        assert f.Vectorize()(2.0) == f(2.0)
+        assert g.Vectorize()(rows).tolist() == [ g(row) for row in rows.tolist() ]
+        assert (P["a"] - P["b"]).Vectorize()(dict(a = x, b = x)).tolist() == [0.0] * 10
+
+        with pytest.raises(Exception):
+            P.Then(len).Vectorize()
+
+    def test_then_at_positions(self):
+        f = lambda *args, **kwargs: (args, kwargs)
+
+        assert P.Then0(f, 1, 2)(0) == ((1, 2), {})
+        assert P.Then(f)(0) == ((0,), {})
+        assert P.Then(f, 1, 2, c = 3)(0) == ((0, 1, 2), dict(c = 3))
+        assert P.Then2(f, 1, 2)(0) == ((1, 0, 2), {})
+        assert P.Then3(f, 1, 2)(0) == ((1, 2, 0), {})
+        assert P.ThenAt(6, f, 1)(0) == ((1, 0), {})
+
+        assert dsl._then_at_partial(1, len, (), {}) is len
+        assert dsl._then_at_factory(1, 2, False) is dsl._then_at_factory(1, 2, False)
@@ -0,0 +1,79 @@
+import pickle
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from phi.numpy_builder import N
+from phi import P
+
+
+class TestNumpyBuilder(object):
+
+    def test_methods(self):
+        x = np.array([[1,2],[3,4]])
+        y = np.array([[5,6],[7,8]])
+
+        z = N.Pipe(
+            x, N
+            .dot(y)
+            .add(x)
+            .transpose()
+            .sum(axis=1)
+        )
+
+        assert np.array_equal(z, np.sum(np.transpose(np.add(np.dot(x, y), x)), axis=1))
+
+    def test_fusion(self):
+        f = N.multiply(2.0).add(1.0).sqrt()
+
+        assert f.Graph()[0] == "Ufuncs"
+        assert len(f.Graph()[1]) == 3
+
+        x = np.arange(4.0)
+
+        assert np.allclose(f(x), np.sqrt(x * 2.0 + 1.0))
+        assert np.allclose(f.Compile()(x), np.sqrt(x * 2.0 + 1.0))
+        assert np.array_equal(x, np.arange(4.0)) # the input is not modified
+
+        g = N.dot(np.eye(2)).add(1.0)
+        x = np.ones((2, 2))
+
+        assert np.array_equal(g(x), x + 1.0)
+        assert np.array_equal(x, np.ones((2, 2)))
+
+    def test_fusion_fallback(self):
+        # different result types
+        f = N.add(1).true_divide(2).greater(1)
+
+        assert f(np.arange(4)).tolist() == [False, False, True, True]
+
+        # broadcast grows the array
+        f = N.add(1.0).add(np.zeros((3, 2)))
+
+        assert f(np.ones(2)).shape == (3, 2)
+
+    def test_pickle(self):
+        f = N.multiply(2.0).add(1.0).sqrt()
+        g = pickle.loads(pickle.dumps(f))
+        x = np.arange(4.0)
+
+        assert g.Graph() == f.Graph()
+        assert np.allclose(g(x), f(x))
+
+        with ProcessPoolExecutor(2) as pool:
+            h = P.ParallelList(N.add(1.0), N.multiply(2.0).sqrt(), N.sum(), executor = pool)
+            ys = h(x)
+
+        assert np.allclose(ys[0], x + 1.0)
+        assert np.allclose(ys[1], np.sqrt(x * 2.0))
+        assert ys[2] == 6.0
+
+    def test_builtin_names(self):
+        # P.sum registers the python builtin before phi.numpy_builder is imported
+        code = "from phi import P; P.sum, P.round; from phi.numpy_builder import N; import numpy as np; print(N.sum(axis=1)(np.ones((2, 3))).tolist())"
+
+        assert subprocess.check_output([sys.executable, "-c", code]).decode().strip() == "[3.0, 3.0]"
@@ -0,0 +1,40 @@
+from phi.api import *
+from phi.profiler import Profiler
+
+
+class TestProfiler(object):
+
+    def test_profile(self):
+
+        f = Seq(
+            Obj.split(' '),
+            P.map(len),
+            list,
+            List(sum, P[0] + P[-1])
+        )
+        g = f.Profile()
+
+        assert g("a bb ccc") == f("a bb ccc") == [6, 4]
+        assert g("dddd") == [4, 8]
+
+        stats = g.Profiler.stats()
+
+        assert [ stats[path]["label"] for path in ["0", "1", "2", "3", "3.0.0", "3.1.0"] ] == ["Obj.split", "map", "list", "List", "sum", "add"]
+        assert stats["0"]["calls"] == 2
+        assert stats["0"]["mean_input_size"] == 6
+        assert stats["2"]["mean_output_size"] == 2
+        assert stats["3"]["time"] >= stats["3.0.0"]["time"]
+
+        assert "Obj.split" in g.Profiler.table()
+        assert g.Profiler.by_label()["[0]"]["calls"] == 2
+
+    def test_shared_profiler(self):
+
+        profiler = Profiler()
+
+        (P + 1).Profile(profiler)(1)
+        (P * 2).Profile(profiler)(1)
+
+        assert profiler.by_label()["add"]["calls"] == 1
+        assert profiler.by_label()["mul"]["calls"] == 1
+        assert list(profiler.stats().keys()) == ["0", "0.1.0", "1/0", "1/0.1.0"]
@@ -1,10 +1,53 @@
 from phi.api import *
+from phi import utils
+import pickle
 
 
 class TestState(object):
 
-    def test_seq(self):
+    def test_state_map_compaction(self):
+        base = utils.StateMap(dict(a = 1))
+        m = base
 
-        f = Seq(lambda x: x + 1)
+        for i in range(utils.StateMap.MAX_DEPTH + 1):
+            m = m.merge({ "k{0}".format(i): i })
 
-        assert f(1) == 2
+        written = { "k{0}".format(i): i for i in range(utils.StateMap.MAX_DEPTH + 1) }
+
+        # the chain was compacted so base is no longer an ancestor
+        assert m._parent is None and m._depth == 0
+        assert dict(m) == dict(written, a = 1)
+        assert m.delta(base) == written
+        assert m.merge(dict(a = 2)).delta(base) == dict(written, a = 2)
+        assert m.merge(dict(k0 = 0)).delta(m) == dict(k0 = 0)
+
+    def test_state_map(self):
+        a = utils.StateMap(dict(x = 1))
+        b = a.merge(dict(y = 2))
+        c = b.merge(dict(x = 3))
+
+        assert dict(a) == dict(x = 1)
+        assert dict(c) == dict(x = 3, y = 2)
+        assert c.delta(a) == dict(x = 3, y = 2)
+        assert c.delta(b) == dict(x = 3)
+        assert "y" in c and "z" not in c
+        assert pickle.loads(pickle.dumps(c)) == c
+
+        for i in range(3 * utils.StateMap.MAX_DEPTH):
+            c = c.merge({ i: i })
+
+        assert c._depth <= utils.StateMap.MAX_DEPTH
+        assert len(c) == 2 + 3 * utils.StateMap.MAX_DEPTH
+
+    def test_many_writes(self):
+        f = Seq(*[ Seq(P + 1, Write(**{ "r{0}".format(i): P })) for i in range(40) ])
+
+        y, state = f(0, True)
+
+        assert y == 40
+        assert state == { "r{0}".format(i): i + 1 for i in range(40) }
+
+    def test_ref_sees_writes(self):
+        f = Seq(Write(a = P + 1), lambda x: Ref.a * 10)
+
+        assert f(1) == 20
@@ -7,7 +7,11 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from collections import namedtuple
+import collections
+import collections.abc
 import inspect
+import itertools
+import sys
 
 def identity(x):
     return x
@@ -15,6 +19,8 @@ def identity(x):
 def state_identity(x, state):
     return x, state
 
+state_identity._pure = identity
+
 def compose2(f, g):
     return lambda x: f(g(x))
 
@@ -25,7 +31,141 @@ def merge(dict_a, dict_b):
     return dict(dict_a, **dict_b)
 
 def lift(f):
-    return lambda x, state: (f(x), state)
+    g = lambda x, state: (f(x), state)
+    g._pure = f
+
+    return g
+
+def batch(iterable, n):
+    it = iter(iterable)
+
+    while True:
+        chunk = list(itertools.islice(it, n))
+
+        if not chunk:
+            return
+
+        yield chunk
+
+def window(iterable, n, step=1):
+    it = iter(iterable)
+    current = collections.deque(itertools.islice(it, n), maxlen=n)
+
+    if len(current) < n:
+        return
+
+    while True:
+        yield tuple(current)
+
+        for _ in range(step):
+            try:
+                current.append(next(it))
+            except StopIteration:
+                return
+
+
+class StateMap(collections.abc.Mapping):
+    """
+Persistent (immutable) mapping that carries the refs through an expression. `merge` returns a new map that keeps the current one as its parent instead of copying it, lookups walk the chain of parents which is compacted into a single level once it gets deeper than `StateMap.MAX_DEPTH`.
+    """
+    MAX_DEPTH = 16
+
+    __slots__ = ("_updates", "_parent", "_depth")
+
+    def __init__(self, updates=(), _parent=None):
+        self._updates = dict(updates)
+        self._parent = _parent
+        self._depth = _parent._depth + 1 if _parent is not None else 0
+
+    def __getitem__(self, key):
+        node = self
+
+        while node is not None:
+            if key in node._updates:
+                return node._updates[key]
+
+            node = node._parent
+
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        node = self
+
+        while node is not None:
+            if key in node._updates:
+                return True
+
+            node = node._parent
+
+        return False
+
+    def __iter__(self):
+        return iter(self._flatten())
+
+    def __len__(self):
+        return len(self._flatten())
+
+    def __repr__(self):
+        return "StateMap({0!r})".format(self._flatten())
+
+    def __reduce__(self):
+        return (StateMap, (self._flatten(),))
+
+    def _flatten(self):
+        if self._parent is None:
+            return self._updates
+
+        nodes = []
+        node = self
+
+        while node is not None:
+            nodes.append(node._updates)
+            node = node._parent
+
+        flat = {}
+
+        for updates in reversed(nodes):
+            flat.update(updates)
+
+        return flat
+
+    def merge(self, updates):
+        "Returns a new `StateMap` with the entries of `updates` added to or replacing the ones in this map, `updates` must not be modified afterwards"
+        if not updates:
+            return self
+
+        if self._depth >= StateMap.MAX_DEPTH:
+            flat = dict(self._flatten())
+            flat.update(updates)
+
+            return StateMap(flat)
+
+        child = StateMap.__new__(StateMap)
+        child._updates = updates
+        child._parent = self
+        child._depth = self._depth + 1
+
+        return child
+
+    def delta(self, base):
+        "Returns a `dict` with the entries of this map that were set on top of `base`"
+        nodes = []
+        node = self
+
+        while node is not None and node is not base:
+            nodes.append(node._updates)
+            node = node._parent
+
+        if node is None and base:
+            # base is not an ancestor e.g. the chain was compacted, compare every entry
+            return { key: value for key, value in self.items() if key not in base or base[key] is not value }
+
+        delta = {}
+
+        for updates in reversed(nodes):
+            delta.update(updates)
+
+        return delta
 
 
 class _NoValue(object):
@@ -70,11 +210,11 @@ def get_method_sig(method):
     eg: "my_method(first_argArg, second_arg=42, third_arg='something')"
     """
 
-    # The return value of ArgSpec is a bit weird, as the list of arguments and
+    # The return value of FullArgSpec is a bit weird, as the list of arguments and
     # list of defaults are returned in separate array.
-    # eg: ArgSpec(args=['first_arg', 'second_arg', 'third_arg'],
-    # varargs=None, keywords=None, defaults=(42, 'something'))
-    argspec = inspect.getargspec(method)
+    # eg: FullArgSpec(args=['first_arg', 'second_arg', 'third_arg'],
+    # varargs=None, varkw=None, defaults=(42, 'something'), ...)
+    argspec = inspect.getfullargspec(method)
     arg_index=0
     args = []
 
@@ -96,25 +236,78 @@ def get_instance_methods(instance):
             yield method_name, method
 
 
+_ATOMIC_ITERABLES = (str, bytes, bytearray)
+
+def _numpy_array_type():
+    # numpy is not imported by phi, if it isn't loaded there can't be any arrays
+    np = sys.modules.get("numpy")
+    return np.ndarray if np is not None else None
+
 def _flatten_list(container):
-    for i in container:
-        if isinstance(i, list):
-            for j in flatten_list(i):
-                yield j
-        else:
+    "Iterative version of the nested lists walk, the lists are kept in a stack so any depth is supported"
+    stack = [iter(container)]
+
+    while stack:
+        for i in stack[-1]:
+            if isinstance(i, list):
+                stack.append(iter(i))
+                break
+
             yield i
+        else:
+            stack.pop()
 
 def flatten_list(container):
-    return list(_flatten_list(container))
+    "Flattens nested `list`s, any other value (including tuples) is kept as is"
+    # the scan would consume iterators, only lists take the shortcut
+    if isinstance(container, list) and not any(isinstance(i, list) for i in container):
+        return list(container)
 
+    return list(_flatten_list(container))
 
 def _flatten(container):
-    for i in container:
-        if hasattr(i, '__iter__'):
-            for j in _flatten(i):
-                yield j
+    "Iterative version of the nested iterables walk, `str`, `bytes` and `bytearray` are not split into characters"
+    ndarray = _numpy_array_type()
+    stack = [iter(container)]
+
+    while stack:
+        for i in stack[-1]:
+            if isinstance(i, _ATOMIC_ITERABLES) or not hasattr(i, '__iter__'):
+                yield i
+
+            elif ndarray is not None and type(i) is ndarray and i.dtype != object:
+                # the elements of a non object array can't be nested
+                for j in i.ravel().tolist():
+                    yield j
+
+            else:
+                stack.append(iter(i))
+                break
         else:
-            yield i
+            stack.pop()
 
 def flatten(container):
-    return list(_flatten(container))
+    """
+Flattens any nesting of iterables into a `list` in linear time without recursion. Strings and bytes are treated as single values and numpy arrays of numbers are flattened in one step with `ravel`.
+    """
+    if isinstance(container, _ATOMIC_ITERABLES):
+        return [container]
+
+    ndarray = _numpy_array_type()
+
+    if ndarray is not None and type(container) is ndarray and container.dtype != object:
+        return container.ravel().tolist()
+
+    result = []
+    extend = result.extend
+
+    for i in container:
+        if isinstance(i, _ATOMIC_ITERABLES) or not hasattr(i, '__iter__'):
+            result.append(i)
+        elif type(i) in (list, tuple) and not any(hasattr(j, '__iter__') for j in i):
+            # a flat sequence of known length, added in one step
+            extend(i)
+        else:
+            extend(_flatten([i]))
+
+    return result